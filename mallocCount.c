@@ -0,0 +1,123 @@
+// LD_PRELOAD shim counting the calls into the allocator and the bytes requested,
+// built into the benchmark image (see Dockerfile), benchmarks read the counters
+// through mallocCountRead (see benchmark.Benchmarker.allocationsTemplate)
+#define _GNU_SOURCE
+#include <dlfcn.h>
+#include <stddef.h>
+#include <string.h>
+
+static void* (*nextMalloc)(size_t);
+static void* (*nextCalloc)(size_t, size_t);
+static void* (*nextRealloc)(void*, size_t);
+static void (*nextFree)(void*);
+static int (*nextPosixMemalign)(void**, size_t, size_t);
+static void* (*nextAlignedAlloc)(size_t, size_t);
+
+static unsigned long long allocations;
+static unsigned long long allocatedBytes;
+
+// dlsym allocates before the functions it looks up are known
+static _Alignas(16) char bootstrap[8192];
+static size_t bootstrapUsed;
+static int resolving;
+
+static void* bootstrapAlloc(size_t size) {
+    size = (size + 15) & ~(size_t)15;
+    if (size > sizeof(bootstrap) - bootstrapUsed) {
+        return NULL;
+    }
+    void* p = bootstrap + bootstrapUsed;
+    bootstrapUsed += size;
+    return p;
+}
+
+static int isBootstrap(void* p) {
+    return (char*)p >= bootstrap && (char*)p < bootstrap + sizeof(bootstrap);
+}
+
+static void resolve(void) {
+    resolving = 1;
+    nextMalloc = dlsym(RTLD_NEXT, "malloc");
+    nextCalloc = dlsym(RTLD_NEXT, "calloc");
+    nextRealloc = dlsym(RTLD_NEXT, "realloc");
+    nextFree = dlsym(RTLD_NEXT, "free");
+    nextPosixMemalign = dlsym(RTLD_NEXT, "posix_memalign");
+    nextAlignedAlloc = dlsym(RTLD_NEXT, "aligned_alloc");
+    resolving = 0;
+}
+
+static void record(size_t size) {
+    __atomic_add_fetch(&allocations, 1, __ATOMIC_RELAXED);
+    __atomic_add_fetch(&allocatedBytes, size, __ATOMIC_RELAXED);
+}
+
+void mallocCountRead(unsigned long long* count, unsigned long long* bytes) {
+    *count = __atomic_load_n(&allocations, __ATOMIC_RELAXED);
+    *bytes = __atomic_load_n(&allocatedBytes, __ATOMIC_RELAXED);
+}
+
+void* malloc(size_t size) {
+    if (nextMalloc == NULL) {
+        if (resolving) {
+            return bootstrapAlloc(size);
+        }
+        resolve();
+    }
+    record(size);
+    return nextMalloc(size);
+}
+
+void* calloc(size_t n, size_t size) {
+    if (nextCalloc == NULL) {
+        // static storage is zeroed already
+        if (resolving) {
+            return bootstrapAlloc(n * size);
+        }
+        resolve();
+    }
+    record(n * size);
+    return nextCalloc(n, size);
+}
+
+// counted as an allocation of the new size
+void* realloc(void* p, size_t size) {
+    if (nextRealloc == NULL) {
+        resolve();
+    }
+    if (isBootstrap(p)) {
+        size_t available = bootstrap + sizeof(bootstrap) - (char*)p;
+        void* q = malloc(size);
+        if (q != NULL) {
+            memcpy(q, p, size < available ? size : available);
+        }
+        return q;
+    }
+    record(size);
+    return nextRealloc(p, size);
+}
+
+void free(void* p) {
+    if (p == NULL || isBootstrap(p)) {
+        return;
+    }
+    if (nextFree == NULL) {
+        resolve();
+    }
+    nextFree(p);
+}
+
+int posix_memalign(void** p, size_t alignment, size_t size) {
+    if (nextPosixMemalign == NULL) {
+        resolve();
+    }
+    record(size);
+    return nextPosixMemalign(p, alignment, size);
+}
+
+void* aligned_alloc(size_t alignment, size_t size) {
+    if (nextAlignedAlloc == NULL) {
+        resolve();
+    }
+    record(size);
+    return nextAlignedAlloc(alignment, size);
+}
@@ -0,0 +1,31 @@
+// generated by processExamples.makePrecompiledHeader
+#include "nanobench.h"
+#include <algorithm>
+#include <any>
+#include <array>
+#include <atomic>
+#include <chrono>
+#include <cmath>
+#include <cstdlib>
+#include <ctime>
+#include <deque>
+#include <dlfcn.h>
+#include <fstream>
+#include <functional>
+#include <iomanip>
+#include <iostream>
+#include <list>
+#include <map>
+#include <memory>
+#include <numeric>
+#include <queue>
+#include <random>
+#include <regex>
+#include <set>
+#include <sstream>
+#include <string>
+#include <sys/resource.h>
+#include <thread>
+#include <unordered_map>
+#include <unordered_set>
+#include <vector>
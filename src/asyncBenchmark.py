@@ -0,0 +1,85 @@
+from __future__ import annotations
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from benchmark import Benchmarker
+
+
+class AsyncBenchmarker:
+    """
+    asyncio front end for Benchmarker.
+    The blocking Docker and socket I/O of each job runs on a thread executor,
+    at most maxConcurrency jobs are in flight, the rest wait on a semaphore.
+    A job that times out or whose task is cancelled has its container killed.
+
+    Usage:
+    async with AsyncBenchmarker(Benchmarker(poolSize=8), maxConcurrency=8) as ab:
+        outputs = await asyncio.gather(*(ab.run(code) for code in codes))
+    """
+
+    def __init__(
+        self,
+        benchmarker: Benchmarker,
+        maxConcurrency: int = 8,
+        timeout: float | None = None,
+    ):
+        self.benchmarker = benchmarker
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(maxConcurrency)
+        self.executor = ThreadPoolExecutor(max_workers=maxConcurrency)
+
+    async def call(self, func, /, *args, timeout: float | None = None, **kwargs):
+        job = Benchmarker.Job()
+        async with self.semaphore:
+            future = asyncio.get_running_loop().run_in_executor(
+                self.executor,
+                functools.partial(func, *args, job=job, **kwargs),
+            )
+            try:
+                return await asyncio.wait_for(
+                    future, timeout if timeout is not None else self.timeout
+                )
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                job.cancel()
+                raise
+
+    async def run(
+        self,
+        code: str,
+        stdout: bool = True,
+        stderr: bool = True,
+        optimized: bool = True,
+        timeout: float | None = None,
+    ) -> Benchmarker.Output:
+        return await self.call(
+            self.benchmarker.run,
+            code,
+            stdout=stdout,
+            stderr=stderr,
+            optimized=optimized,
+            timeout=timeout,
+        )
+
+    async def compareOutputs(
+        self,
+        codeA: str,
+        codeB: str,
+        timeout: float | None = None,
+    ) -> Benchmarker.OutputComparison:
+        outputA, outputB = await asyncio.gather(
+            self.run(codeA, timeout=timeout),
+            self.run(codeB, timeout=timeout),
+        )
+        return Benchmarker.compare(outputA, outputB)
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self.executor.shutdown, wait=True)
+        )
+        self.benchmarker.close()
+
+    async def __aenter__(self) -> AsyncBenchmarker:
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
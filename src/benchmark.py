@@ -1,13 +1,44 @@
 from __future__ import annotations
 import docker
+import hashlib
+import json
+import re
 import socket
-import struct
-from dataclasses import dataclass
+import threading
+import uuid
+import warnings
+from dataclasses import asdict, dataclass
+from functools import cached_property
+from pathlib import PosixPath as Path
+from typing import Callable, Literal
+from docker.errors import APIError, NotFound
+from binaryCache import BinaryCache
+from containerPool import ContainerPool
+
+includeRegex = re.compile(r"#include[^\n]*")
+
+
+def normalizeInclude(include: str) -> str:
+    return re.sub(r"\s+", "", include)
+
+
+# nanobench: timed epochs, callgrind: one simulated run counting instructions,
+# cache misses and branch mispredicts, deterministic but not a runtime
+Engine = Literal["nanobench", "callgrind"]
+
+# perf: sampled call stacks, needs perf_event access,
+# callgrind: instructions per function, flat
+Profiler = Literal["perf", "callgrind"]
+
+# outcome of a benchmark job, see Benchmarker.status
+Status = Literal["ok", "compileFailed", "executionFailed", "timeout", "oom"]
 
 
 class Benchmarker:
     compFailMsg = "Compilation failed"
     execFailMsg = "Execution failed"
+    timeoutMsg = "Time limit exceeded"
+    oomMsg = "Memory limit exceeded"
 
     codeTemplate = """\
 #include "nanobench.h"
@@ -15,6 +46,8 @@ class Benchmarker:
 #include <chrono>
 {includes}
 
+{benchmarkHelpers}
+
 {additionalDefs}
 
 void benchmarkFunc() {{
@@ -22,50 +55,600 @@ void benchmarkFunc() {{
 }}
 
 int main() {{
+{benchmarkSetup}
+    runBenchmark(benchmark, "test", []() {{benchmarkFunc();}});
+    benchmark.render("{nanobenchOutputTemplate}", std::cerr);
+}}
+"""
+
+    # benchmarkFunc runs once, only it and its callees are counted by callgrind
+    callgrindTemplate = """\
+#include <iostream>
+{includes}
+
+{additionalDefs}
+
+__attribute__((noinline)) void benchmarkFunc() {{
+    {benchmarkBody}
+}}
+
+int main() {{
+    benchmarkFunc();
+}}
+"""
+
+    callgrindCommand = (
+        "valgrind",
+        "--tool=callgrind",
+        "--callgrind-out-file=/dev/null",
+        "--cache-sim=yes",
+        "--branch-sim=yes",
+        "--toggle-collect='benchmarkFunc*'",
+    )
+
+    # summary valgrind prints to stderr on exit, e.g.
+    # ==42== Events    : Ir Dr Dw I1mr D1mr D1mw ILmr DLmr DLmw Bc Bcm Bi Bim
+    # ==42== Collected : 1204 ...
+    callgrindEventsRegex = re.compile(r"^==\d+== Events\s*:(.*)$", re.MULTILINE)
+    callgrindCollectedRegex = re.compile(r"^==\d+== Collected\s*:(.*)$", re.MULTILINE)
+
+    # several snippets in one program, each isolated in its own namespace
+    batchTemplate = """\
+#include "nanobench.h"
+#include <iostream>
+#include <chrono>
+{includes}
+
+{benchmarkHelpers}
+
+{namespaces}
+
+int main() {{
+{benchmarkSetup}
+{benchmarkRuns}
+    benchmark.render("{nanobenchOutputTemplate}", std::cerr);
+}}
+"""
+
+    batchNamespaceTemplate = """\
+namespace {name} {{
+{additionalDefs}
+
+void benchmarkFunc() {{
+    {benchmarkBody}
+}}
+}} // namespace {name}
+"""
+
+    batchRunTemplate = """\
+    runBenchmark(benchmark, "{name}", []() {{{name}::benchmarkFunc();}});"""
+
+    # baseline and candidate in one program (namespaces as in batchTemplate),
+    # both calibrated to epochs of about epochTimeMs, then single epochs
+    # alternate between them, reported as per iteration runtimes per pair
+    pairTemplate = """\
+#include "nanobench.h"
+#include <algorithm>
+#include <chrono>
+#include <iomanip>
+#include <iostream>
+#include <vector>
+{includes}
+
+{namespaces}
+
+using Measure = ankerl::nanobench::Result::Measure;
+
+template <typename Op>
+uint64_t calibrate(Op op) {{
+    ankerl::nanobench::Bench bench;
+    bench
+    .output(nullptr)
+    .epochs({calibrationEpochs})
+    .minEpochIterations(1)
+    .minEpochTime(std::chrono::milliseconds({epochTimeMs}));
+    bench.run("calibration", op);
+    return std::max<uint64_t>(1, bench.results().back().median(Measure::iterations));
+}}
+
+template <typename Op>
+double runEpoch(ankerl::nanobench::Bench& bench, Op op) {{
+    bench.run("epoch", op);
+    return bench.results().back().median(Measure::elapsed);
+}}
+
+void printSamples(char const* name, std::vector<double> const& samples) {{
+    std::cerr << "\\"" << name << "\\": [";
+    for (size_t i = 0; i < samples.size(); ++i) {{
+        std::cerr << (i > 0 ? ", " : "") << samples[i];
+    }}
+    std::cerr << "]";
+}}
+
+int main() {{
+    auto baselineOp = []() {{baseline::benchmarkFunc();}};
+    auto candidateOp = []() {{candidate::benchmarkFunc();}};
+
+    ankerl::nanobench::Bench baselineBench;
+    baselineBench.output(nullptr).epochs(1).epochIterations(calibrate(baselineOp));
+    ankerl::nanobench::Bench candidateBench;
+    candidateBench.output(nullptr).epochs(1).epochIterations(calibrate(candidateOp));
+
+    std::vector<double> baselineSamples;
+    std::vector<double> candidateSamples;
+    for (int pair = 0; pair < {pairs}; ++pair) {{
+        // flip the order every pair so that drift within a pair cancels out
+        if (pair % 2 == 0) {{
+            baselineSamples.push_back(runEpoch(baselineBench, baselineOp));
+            candidateSamples.push_back(runEpoch(candidateBench, candidateOp));
+        }} else {{
+            candidateSamples.push_back(runEpoch(candidateBench, candidateOp));
+            baselineSamples.push_back(runEpoch(baselineBench, baselineOp));
+        }}
+    }}
+
+    std::cerr << std::setprecision(17) << "{{ \\"name\\": \\"pair\\", ";
+    printSamples("baseline", baselineSamples);
+    std::cerr << ", ";
+    printSamples("candidate", candidateSamples);
+    std::cerr << " }}\\n";
+}}
+"""
+
+    benchmarkSetupTemplate = """\
     ankerl::nanobench::Bench benchmark;
     benchmark
     .output(nullptr)
+    .performanceCounters({performanceCounters})
     .epochs({epochs})
     .minEpochIterations({minEpochIterations})
     .minEpochTime(std::chrono::duration_cast<std::chrono::nanoseconds>(
         std::chrono::milliseconds({minEpochTimeMs})
-    ));
-    benchmark.run("test", []() {{benchmarkFunc();}});
-    benchmark.render("{nanobenchOutputTemplate}", std::cerr);
-}}
-"""
+    ));"""
+
+    runBenchmarkTemplate = """\
+template <typename Op>
+void runBenchmark(ankerl::nanobench::Bench& bench, char const* name, Op op) {{
+{beforeRun}    bench.run(name, op);
+}}"""
+
+    # calibrates the epoch length per benchmark from a short run, aiming for
+    # targetError median absolute percent error within timeBudgetMs
+    runBenchmarkAdaptiveTemplate = """\
+#include <algorithm>
+#include <cmath>
+
+template <typename Op>
+void runBenchmark(ankerl::nanobench::Bench& bench, char const* name, Op op) {{
+{beforeRun}    using Measure = ankerl::nanobench::Result::Measure;
+
+    ankerl::nanobench::Bench calibration;
+    calibration
+    .output(nullptr)
+    .epochs({calibrationEpochs})
+    .minEpochIterations(1)
+    .minEpochTime(std::chrono::milliseconds({calibrationEpochTimeMs}));
+    calibration.run(name, op);
+    auto const& result = calibration.results().back();
+
+    double error = result.medianAbsolutePercentError(Measure::elapsed);
+    double epochTime =
+        result.sumProduct(Measure::iterations, Measure::elapsed) / result.size();
+    double budget = {timeBudgetMs} / 1000.0;
+    double epochs = {epochs};
+
+    // the spread between epochs shrinks roughly with the square root of the
+    // epoch length, while more epochs only estimate it more precisely
+    double needed = std::max(1.0, std::pow(error / {targetError}, 2.0));
+    epochTime *= std::clamp(needed, 1.0, std::max(1.0, budget / epochs / epochTime));
+
+    auto epochTimeNs = std::chrono::duration_cast<std::chrono::nanoseconds>(
+        std::chrono::duration<double>(epochTime)
+    );
+    bench
+    .epochs(static_cast<size_t>(epochs))
+    .minEpochIterations(1)
+    .minEpochTime(epochTimeNs)
+    .maxEpochTime(std::max(epochTimeNs, std::chrono::nanoseconds(100000000)));
+    bench.run(name, op);
+}}"""
+
+    # in the pass with the malloc counting shim preloaded (see Dockerfile and
+    # execute) op only runs to report the calls into the shim instead of being
+    # timed, the peak RSS is the one of the whole process so far
+    allocationsTemplate = """\
+#include <dlfcn.h>
+#include <sys/resource.h>
+
+template <typename Op>
+bool reportAllocations(char const* name, Op op) {{
+    using Read = void (*)(unsigned long long*, unsigned long long*);
+    auto read = reinterpret_cast<Read>(dlsym(RTLD_DEFAULT, "mallocCountRead"));
+    if (read == nullptr) {{
+        return false;
+    }}
+    unsigned long long countBefore, bytesBefore, countAfter, bytesAfter;
+    read(&countBefore, &bytesBefore);
+    for (int i = 0; i < {iterations}; ++i) {{
+        op();
+    }}
+    read(&countAfter, &bytesAfter);
+    long long allocations = countAfter - countBefore;
+    long long allocatedBytes = bytesAfter - bytesBefore;
+    rusage usage{{}};
+    getrusage(RUSAGE_SELF, &usage);
+    std::cerr << "{{ \\"name\\": \\"" << name << "\\", "
+        << "\\"allocations\\": " << allocations << ", "
+        << "\\"allocatedBytes\\": " << allocatedBytes << ", "
+        << "\\"allocationIterations\\": " << {iterations} << ", "
+        << "\\"peakRss\\": " << usage.ru_maxrss * 1024LL << " }}\\n";
+    return true;
+}}"""
+
+    def renderBenchmarkHelpers(self) -> str:
+        options = self.nanobenchOptions
+        beforeRun = (
+            "    if (reportAllocations(name, op)) {\n        return;\n    }\n"
+            if options.allocations
+            else ""
+        )
+        if not options.adaptive:
+            runBenchmark = Benchmarker.runBenchmarkTemplate.format(beforeRun=beforeRun)
+        else:
+            runBenchmark = Benchmarker.runBenchmarkAdaptiveTemplate.format(
+                calibrationEpochs=options.calibrationEpochs,
+                calibrationEpochTimeMs=options.calibrationEpochTimeMs,
+                timeBudgetMs=options.timeBudgetMs,
+                epochs=options.adaptiveEpochs,
+                targetError=options.targetError,
+                beforeRun=beforeRun,
+            )
+        if not options.allocations:
+            return runBenchmark
+        allocations = Benchmarker.allocationsTemplate.format(
+            iterations=options.allocationIterations
+        )
+        return allocations + "\n\n" + runBenchmark
+
+    def renderBenchmarkSetup(self) -> str:
+        return Benchmarker.benchmarkSetupTemplate.format(
+            performanceCounters=(
+                "true" if self.nanobenchOptions.performanceCounters else "false"
+            ),
+            epochs=self.nanobenchOptions.epochs,
+            minEpochIterations=self.nanobenchOptions.minEpochIterations,
+            minEpochTimeMs=self.nanobenchOptions.minEpochTimeMs,
+        )
+
+    def renderOutputTemplate(self) -> str:
+        # counter lines carry the benchmark name and are merged by parseRecords
+        options = self.nanobenchOptions
+        if options.performanceCounters:
+            return options.outputTemplate + options.counterTemplate
+        return options.outputTemplate
+
+    @staticmethod
+    def renderCallgrindTemplate(code: Code) -> str:
+        return Benchmarker.callgrindTemplate.format(
+            includes="\n".join(code.includes),
+            additionalDefs=code.additionalDefs,
+            benchmarkBody=code.body,
+        )
 
     def renderTemplate(self, code: Code) -> str:
+        if self.engine == "callgrind":
+            return Benchmarker.renderCallgrindTemplate(code)
 
         return Benchmarker.codeTemplate.format(
             includes="\n".join(code.includes),
             additionalDefs=code.additionalDefs,
             benchmarkBody=code.body,
-            epochs=self.nanobenchOptions.epochs,
-            minEpochIterations=self.nanobenchOptions.minEpochIterations,
-            minEpochTimeMs=self.nanobenchOptions.minEpochTimeMs,
-            nanobenchOutputTemplate=self.nanobenchOptions.outputTemplate,
+            benchmarkHelpers=self.renderBenchmarkHelpers(),
+            benchmarkSetup=self.renderBenchmarkSetup(),
+            nanobenchOutputTemplate=self.renderOutputTemplate(),
+        )
+
+    @staticmethod
+    def batchTaskName(i: int) -> str:
+        return f"task{i}"
+
+    def renderPairTemplate(
+        self,
+        baseline: Code,
+        candidate: Code,
+        options: PairOptions | None = None,
+    ) -> str:
+        """
+        render baseline and candidate into one program measuring them
+        interleaved, see parsePair
+        """
+        if self.engine != "nanobench":
+            raise ValueError(f"Pairs are not supported by the {self.engine} engine")
+        options = options if options is not None else Benchmarker.PairOptions()
+        codes = dict(baseline=baseline, candidate=candidate)
+        includes = dict.fromkeys(
+            include for code in codes.values() for include in code.includes
+        )
+        return Benchmarker.pairTemplate.format(
+            includes="\n".join(includes),
+            namespaces="\n".join(
+                Benchmarker.batchNamespaceTemplate.format(
+                    name=name,
+                    additionalDefs=code.additionalDefs,
+                    benchmarkBody=code.body,
+                )
+                for name, code in codes.items()
+            ),
+            calibrationEpochs=options.calibrationEpochs,
+            epochTimeMs=options.epochTimeMs,
+            pairs=options.pairs,
+        )
+
+    @staticmethod
+    def parsePair(output: str) -> tuple[list[float], list[float]] | None:
+        """
+        per iteration runtimes of baseline and candidate per pair,
+        None if the pair program did not report them
+        """
+        record = Benchmarker.parseRecords(output).get("pair")
+        if record is None or "baseline" not in record or "candidate" not in record:
+            return None
+        return record["baseline"], record["candidate"]
+
+    def renderBatchTemplate(self, codes: list[Code]) -> str:
+        """
+        render codes into one program, the result of the i-th code is
+        reported under the name batchTaskName(i)
+        """
+        if self.engine != "nanobench":
+            raise ValueError(f"Batches are not supported by the {self.engine} engine")
+        includes = dict.fromkeys(include for code in codes for include in code.includes)
+        names = [Benchmarker.batchTaskName(i) for i in range(len(codes))]
+
+        return Benchmarker.batchTemplate.format(
+            includes="\n".join(includes),
+            namespaces="\n".join(
+                Benchmarker.batchNamespaceTemplate.format(
+                    name=name,
+                    additionalDefs=code.additionalDefs,
+                    benchmarkBody=code.body,
+                )
+                for name, code in zip(names, codes)
+            ),
+            benchmarkHelpers=self.renderBenchmarkHelpers(),
+            benchmarkSetup=self.renderBenchmarkSetup(),
+            benchmarkRuns="\n".join(
+                Benchmarker.batchRunTemplate.format(name=name) for name in names
+            ),
+            nanobenchOutputTemplate=self.renderOutputTemplate(),
         )
 
+    @staticmethod
+    def parseRecords(output: str) -> dict[str, dict]:
+        """
+        parse the JSON lines rendered by outputTemplate, keyed by benchmark name
+        """
+        records = dict()
+        for line in output.splitlines():
+            line = line.strip()
+            if not line.startswith("{"):
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "name" in record:
+                records.setdefault(record["name"], dict()).update(record)
+        return records
+
+    # perf script prints a header line per sample followed by its frames from
+    # the leaf to the root, e.g.
+    #     401136 benchmarkFunc()+0x16 (/build/3f.../benchmark)
+    perfFrameRegex = re.compile(
+        r"^\s*[0-9a-f]+\s+(?P<symbol>.*?)(?:\+0x[0-9a-f]+)?\s+\((?P<dso>[^)]*)\)$"
+    )
+    # function table of callgrind_annotate, e.g.
+    # 1,204 (12.34%)  ???:benchmarkFunc() [/build/3f.../benchmark]
+    callgrindAnnotateRegex = re.compile(
+        r"^\s*(?P<count>[\d,]+)\s+(?:\(\s*[\d.]+%\)\s+)?"
+        r"(?P<location>\S.*?)(?:\s+\[[^\]]*\])?$"
+    )
+
+    @staticmethod
+    def foldPerfScript(output: str) -> dict[str, int]:
+        """
+        count the identical call stacks of perf script output, keyed by their
+        frames from the root to the leaf joined by ";" (folded stacks)
+        """
+        stacks = dict()
+        for sample in output.split("\n\n"):
+            frames = []
+            for line in sample.strip("\n").splitlines()[1:]:
+                if match := Benchmarker.perfFrameRegex.match(line):
+                    symbol = match["symbol"]
+                    if symbol == "[unknown]":
+                        symbol = f"[{Path(match['dso']).name}]"
+                    frames.append(symbol.replace(";", ":"))
+            if frames:
+                stack = ";".join(reversed(frames))
+                stacks[stack] = stacks.get(stack, 0) + 1
+        return stacks
+
+    @staticmethod
+    def parseCallgrindAnnotate(output: str) -> dict[str, int]:
+        """
+        instructions per function of a callgrind_annotate function table,
+        as single frame stacks like foldPerfScript
+        """
+        counts = dict()
+        inTable = False
+        for line in output.splitlines():
+            if "file:function" in line:
+                inTable = True
+            elif inTable and not line.strip() and counts:
+                break
+            elif inTable and (match := Benchmarker.callgrindAnnotateRegex.match(line)):
+                if "PROGRAM TOTALS" in match["location"]:
+                    continue
+                # strip the file, function names may contain "::" themselves
+                symbol = match["location"].split(":", 1)[-1].replace(";", ":")
+                count = int(match["count"].replace(",", ""))
+                counts[symbol] = counts.get(symbol, 0) + count
+        return counts
+
+    @staticmethod
+    def parseCallgrind(output: str) -> dict[str, int]:
+        """
+        parse the event counts of the callgrind summary, empty if there is none
+        """
+        events = re.search(Benchmarker.callgrindEventsRegex, output)
+        collected = re.search(Benchmarker.callgrindCollectedRegex, output)
+        if events is None or collected is None:
+            return dict()
+        return dict(zip(events[1].split(), map(int, collected[1].split())))
+
+    @staticmethod
+    def demultiplex(output: Output, count: int) -> list[Output] | None:
+        """
+        split the output of a batch program into per-snippet outputs,
+        None if the batch did not produce a result for every snippet
+        """
+        if (
+            Benchmarker.compFailMsg in output.stderr
+            or Benchmarker.execFailMsg in output.stderr
+        ):
+            return None
+        records = Benchmarker.parseRecords(output.stderr)
+        names = [Benchmarker.batchTaskName(i) for i in range(count)]
+        if not all(name in records for name in names):
+            return None
+        return [
+            Benchmarker.Output(stdout="", stderr=json.dumps(records[name]))
+            for name in names
+        ]
+
     @dataclass
     class Code:
         includes: list[str]
         additionalDefs: str
         body: str
 
+    @dataclass
+    class PairOptions:
+        pairs: int = 30
+        epochTimeMs: int = 10
+        calibrationEpochs: int = 3
+
     @dataclass
     class NanobenchOptions:
         epochs: int = 15
         minEpochIterations: int = 10
         minEpochTimeMs: int = 100
+        # adaptive mode replaces the fixed settings above per benchmark
+        adaptive: bool = False
+        targetError: float = 0.01
+        timeBudgetMs: int = 2000
+        calibrationEpochs: int = 3
+        calibrationEpochTimeMs: int = 5
+        adaptiveEpochs: int = 5
+        # one JSON object per line and benchmark
         outputTemplate: str = (
-            '{ {{#result}} \\"runtimeAvg\\": {{average(elapsed)}} {{/result}} }'
+            "{{#result}}"
+            '{ \\"name\\": \\"{{name}}\\", '
+            '\\"runtimeAvg\\": {{average(elapsed)}}, '
+            '\\"runtimeError\\": {{medianAbsolutePercentError(elapsed)}}, '
+            '\\"epochs\\": {{epochs}}, '
+            '\\"minEpochIterations\\": {{minEpochIterations}}, '
+            '\\"minEpochTime\\": {{minEpochTime}}, '
+            # per epoch: [elapsed time per iteration, iterations]
+            '\\"samples\\": [{{#measurement}}[{{elapsed}}, {{iterations}}]'
+            "{{^-last}}, {{/-last}}{{/measurement}}] }\\n"
+            "{{/result}}"
         )
+        # allocation counts (through the shim preloaded by execute) and peak RSS
+        allocations: bool = False
+        allocationIterations: int = 10
+        # hardware counters (medians per iteration), needs perf_event access
+        performanceCounters: bool = False
+        counterTemplate: str = (
+            "{{#result}}"
+            '{ \\"name\\": \\"{{name}}\\", '
+            '\\"instructions\\": {{median(instructions)}}, '
+            '\\"cpucycles\\": {{median(cpucycles)}}, '
+            '\\"branchinstructions\\": {{median(branchinstructions)}}, '
+            '\\"branchmisses\\": {{median(branchmisses)}} }\\n'
+            "{{/result}}"
+        )
+
+    @dataclass
+    class Limits:
+        """
+        budgets of a single job, a command still running after its timeout
+        (seconds) is terminated and killed killAfter seconds later;
+        memLimit (docker size string, swap disabled), pidsLimit and cpus
+        apply to every container
+        """
+
+        compileTimeout: float = 120.0
+        executeTimeout: float = 300.0
+        killAfter: float = 5.0
+        memLimit: str | None = "4g"
+        pidsLimit: int | None = 256
+        cpus: float | None = None
 
     @dataclass
     class Output:
         stdout: str
         stderr: str
+        truncated: bool = False
+
+    @dataclass
+    class Build:
+        key: str
+        output: Benchmarker.Output
+        compiled: bool = False
+        cached: bool = False
+
+        @property
+        def binary(self) -> str:
+            return f"{Benchmarker.buildMount}/{self.key}/{BinaryCache.binaryName}"
+
+    class Cancelled(Exception):
+        pass
+
+    class TimedOut(Exception):
+        """
+        a command outlived its timeout inside the container, its container
+        was killed from the host
+        """
+
+    class Job:
+        """
+        handle for aborting a running job from another thread,
+        cancelling kills the container the job is running in
+        """
+
+        def __init__(self):
+            self.lock = threading.Lock()
+            self.cancelled = False
+            self.container = None
+
+        def attach(self, container):
+            with self.lock:
+                if self.cancelled:
+                    raise Benchmarker.Cancelled
+                self.container = container
+
+        def detach(self):
+            with self.lock:
+                self.container = None
+
+        def cancel(self):
+            with self.lock:
+                self.cancelled = True
+                container = self.container
+            if container is not None:
+                Benchmarker.kill(container)
 
     @dataclass
     class OutputComparison:
@@ -74,43 +657,214 @@ int main() {{
         match: bool = False
 
     @staticmethod
-    def readStreamsFromSock(sock, stdout=True, stderr=True) -> Output:
-        # stream identifiers: stdout: 1 , stderr: 2
-        buffers = [None, b"", b""]
+    def recvInto(sock, view: memoryview) -> int:
+        """
+        fill view from sock, returns the number of bytes received,
+        which is less than len(view) only if the stream ended
+        """
+        received = 0
+        while received < len(view):
+            n = sock.recv_into(view[received:])
+            if n == 0:
+                break
+            received += n
+        return received
+
+    @staticmethod
+    def readStreamsFromSock(
+        sock,
+        stdout: bool = True,
+        stderr: bool = True,
+        maxBytes: int | None = None,
+        onFrame: Callable[[int, memoryview], None] | None = None,
+    ) -> Output:
+        """
+        demultiplex a docker attach stream, every frame is an 8 byte header
+        (stream id, 3 bytes padding, big endian payload length) and the payload
 
+        maxBytes caps the output kept per stream, the remainder is still read
+        and dropped so that the container can finish writing
+        onFrame is called with (stream id, payload) for the payload of every
+        frame of a selected stream (in several pieces for large frames),
+        the payload view is only valid during the call
+        """
+        # stream identifiers: stdout: 1 , stderr: 2
         streams = 0b00
         streams |= stdout
         streams |= stderr << 1
 
-        while True:
-            header = sock.recv(8)
-            if len(header) < 8:
-                break
-            (streamID, *_) = struct.unpack(">B", header[0:1])
-            (payloadLen, *_) = struct.unpack(">I", header[4:8])
-            if payloadLen > 0 and len(payload := sock.recv(payloadLen)) == payloadLen:
-                if streamID & streams:
-                    buffers[streamID] += payload
-            else:
-                break
+        buffers = [None, bytearray(4096), bytearray(4096)]
+        used = [0, 0, 0]
+        scratch = memoryview(bytearray(64 * 1024))
+        header = memoryview(bytearray(8))
+        truncated = False
+
+        def read(view: memoryview, streamID: int, selected: bool) -> int:
+            received = Benchmarker.recvInto(sock, view)
+            if selected and onFrame is not None and received:
+                onFrame(streamID, view[:received])
+            return received
+
+        complete = True
+        while complete and Benchmarker.recvInto(sock, header) == len(header):
+            streamID = header[0]
+            payloadLen = int.from_bytes(header[4:8], "big")
+            selected = streamID in (1, 2) and bool(streamID & streams)
+
+            kept = 0
+            if selected:
+                buffer = buffers[streamID]
+                start = used[streamID]
+                kept = payloadLen
+                if maxBytes is not None:
+                    kept = max(0, min(payloadLen, maxBytes - start))
+                    truncated |= kept < payloadLen
+                if start + kept > len(buffer):
+                    # grow geometrically, views have to be released before resizing
+                    buffer.extend(bytes(max(kept, len(buffer))))
+                with memoryview(buffer) as whole, whole[start : start + kept] as view:
+                    received = read(view, streamID, selected)
+                used[streamID] += received
+                complete = received == kept
+
+            # drop whatever is not kept
+            remaining = payloadLen - kept
+            while complete and remaining > 0:
+                chunk = scratch[: min(remaining, len(scratch))]
+                complete = read(chunk, streamID, selected) == len(chunk)
+                remaining -= len(chunk)
+
         return Benchmarker.Output(
-            stdout=buffers[1].decode(errors="ignore"),
-            stderr=buffers[2].decode(errors="ignore"),
+            stdout=buffers[1][: used[1]].decode(errors="ignore"),
+            stderr=buffers[2][: used[2]].decode(errors="ignore"),
+            truncated=truncated,
         )
 
+    buildMount = "/build"
+    mallocCountLib = "/usr/src/libmalloccount.so"
+    perfEventParanoidPath = "/proc/sys/kernel/perf_event_paranoid"
+    # precompiled headers are built in the image once per optimization level
+    pchTemplate = "/usr/src/pch/{optLevel}/pch.h"
+
     def __init__(
         self,
         benchmarkImg: str = "localhost/benchmark",
         nanobenchOptions: NanobenchOptions = NanobenchOptions(),
+        poolSize: int = 0,
+        poolRecycleAfter: int = 100,
+        cacheDir: str = str(Path.home() / ".cache" / "benchmark-binaries"),
+        cacheMaxBytes: int = 2 * 1024**3,
+        precompiledHeader: str | None = "pch.h",
+        engine: Engine = "nanobench",
+        limits: Limits = Limits(),
+        perfAccess: bool = False,
+        maxOutputBytes: int | None = 64 * 1024**2,
     ):
+        """
+        poolSize > 0 starts that many long-lived containers up front and
+        dispatches jobs into them with exec instead of creating a container per job
+
+        cacheDir is the host directory mounted into every container; compiled
+        binaries are kept there keyed by source, flags and image, so unchanged
+        code is only compiled once
+
+        precompiledHeader is the header the image's precompiled header was built
+        from; snippets whose includes it covers are compiled against it
+
+        engine selects how executions are measured, see Engine
+
+        limits bounds the time and resources of every compile and execution
+
+        perfAccess grants the containers access to perf_event_open as needed
+        by profile with perf, it is implied by hardware performance counters
+
+        maxOutputBytes caps the output kept per stream of every command, the
+        rest is dropped and the output marked as truncated
+        """
+        self.engine = engine
+        self.limits = limits
+        self.perfAccess = perfAccess or nanobenchOptions.performanceCounters
+        self.maxOutputBytes = maxOutputBytes
         self.client = docker.from_env()
         self.benchmarkImg = benchmarkImg
         self.nanobenchOptions = nanobenchOptions
+        if self.perfAccess:
+            paranoid = Benchmarker.perfEventParanoid()
+            if paranoid is None or paranoid > 2:
+                # nanobench silently skips counters it cannot open
+                warnings.warn(
+                    f"perf_event_paranoid is {paranoid}, hardware counters and "
+                    "perf profiles are only available if the container runtime "
+                    "grants CAP_PERFMON"
+                )
+        self.cache = BinaryCache(cacheDir, maxBytes=cacheMaxBytes)
+        self.pchIncludes = frozenset()
+        if precompiledHeader is not None and Path(precompiledHeader).is_file():
+            with open(precompiledHeader, "r") as f:
+                self.pchIncludes = frozenset(
+                    map(normalizeInclude, re.findall(includeRegex, f.read()))
+                )
+        self.pool = (
+            ContainerPool(
+                self.client,
+                image=benchmarkImg,
+                size=poolSize,
+                recycleAfter=poolRecycleAfter,
+                containerOptions=self.containerOptions(),
+            )
+            if poolSize > 0
+            else None
+        )
+
+    def containerOptions(self) -> dict:
+        options = dict(
+            working_dir="/usr/src",
+            volumes={
+                str(self.cache.root): dict(bind=Benchmarker.buildMount, mode="rw"),
+            },
+        )
+        if self.limits.memLimit is not None:
+            # without swap the OOM killer ends the job instead of thrashing
+            options |= dict(
+                mem_limit=self.limits.memLimit, memswap_limit=self.limits.memLimit
+            )
+        if self.limits.pidsLimit is not None:
+            options |= dict(pids_limit=self.limits.pidsLimit)
+        if self.limits.cpus is not None:
+            options |= dict(nano_cpus=int(self.limits.cpus * 1e9))
+        if self.perfAccess:
+            # perf_event_open is blocked by the default seccomp profile and
+            # CAP_PERFMON lifts the perf_event_paranoid restriction
+            options |= dict(cap_add=["PERFMON"], security_opt=["seccomp=unconfined"])
+        return options
+
+    @staticmethod
+    def perfEventParanoid() -> int | None:
+        try:
+            with open(Benchmarker.perfEventParanoidPath, "r") as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
+
+    @cached_property
+    def imageDigest(self) -> str:
+        return self.client.images.get(self.benchmarkImg).id
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+
+    def __enter__(self) -> Benchmarker:
+        return self
+
+    def __exit__(self, *_):
+        self.close()
 
     def compareOutputs(self, codeA: str, codeB: str) -> OutputComparison:
-        outputA = self.run(codeA)
-        outputB = self.run(codeB)
+        return Benchmarker.compare(self.run(codeA), self.run(codeB))
 
+    @staticmethod
+    def compare(outputA: Output, outputB: Output) -> OutputComparison:
         result = Benchmarker.OutputComparison(outputA, outputB)
 
         for output in (outputA, outputB):
@@ -123,49 +877,383 @@ int main() {{
         result.match = outputA.stdout == outputB.stdout
         return result
 
-    def run(
+    @staticmethod
+    def status(output: Output) -> Status:
+        for msg, status in (
+            (Benchmarker.timeoutMsg, "timeout"),
+            (Benchmarker.oomMsg, "oom"),
+            (Benchmarker.compFailMsg, "compileFailed"),
+            (Benchmarker.execFailMsg, "executionFailed"),
+        ):
+            if msg in output.stderr:
+                return status
+        return "ok"
+
+    def limitCommand(self, command: str, timeout: float, failMsg: str) -> str:
+        """
+        shell command running command under timeout, reporting the
+        exceeded limit and failMsg on stderr if it fails
+        """
+        return "; ".join(
+            (
+                "start=$(date +%s)",
+                f"timeout -k {self.limits.killAfter} {timeout} {command}",
+                "exitCode=$?",
+                "elapsed=$(($(date +%s) - start))",
+                # 124: terminated by timeout, 137: SIGKILL, sent by timeout if the
+                # command ignored SIGTERM and otherwise by the OOM killer
+                "if [ $exitCode -eq 124 ] || "
+                f"[ $exitCode -eq 137 -a $elapsed -ge {int(timeout)} ]",
+                f'then echo "{Benchmarker.timeoutMsg}" 1>&2',
+                "elif [ $exitCode -eq 137 ]",
+                f'then echo "{Benchmarker.oomMsg}" 1>&2',
+                "fi",
+                "if [ $exitCode -ne 0 ]",
+                f'then echo "{failMsg}" 1>&2; exit 1',
+                "fi",
+            )
+        )
+
+    def hostTimeout(self, timeout: float) -> float:
+        """
+        time without output after which the host gives up on a command,
+        the container should have killed it long before
+        """
+        return timeout + self.limits.killAfter + 30.0
+
+    @staticmethod
+    def communicate(
+        socketIO,
+        stdin: bytes,
+        stdout: bool,
+        stderr: bool,
+        timeout: float | None = None,
+        maxBytes: int | None = None,
+    ) -> Output:
+        sock = socketIO._sock
+        sock.settimeout(timeout)
+        sock.sendall(stdin)
+        sock.shutdown(socket.SHUT_WR)
+        try:
+            return Benchmarker.readStreamsFromSock(
+                sock, stdout=stdout, stderr=stderr, maxBytes=maxBytes
+            )
+        finally:
+            socketIO.close()
+
+    def runCommand(
         self,
-        code: str,
+        shellCommand: str,
+        stdin: bytes = b"",
         stdout: bool = True,
         stderr: bool = True,
-        optimized: bool = True,
+        cpus: str | None = None,
+        job: Job | None = None,
+        timeout: float | None = None,
     ) -> Output:
+        """
+        cpus restricts the command to the given cpu list (e.g. "2" or "2,3")
+        timeout (seconds without output) kills the container and raises TimedOut
+        """
+        job = job if job is not None else Benchmarker.Job()
+        if self.pool is None:
+            # attached before it starts, a short command could finish and lose
+            # its output before the host attaches otherwise
+            container = self.client.containers.create(
+                self.benchmarkImg,
+                ["sh", "-c", shellCommand],
+                stdin_open=True,
+                cpuset_cpus=cpus,
+                **self.containerOptions(),
+            )
+            try:
+                job.attach(container)
+                socketIO = container.attach_socket(
+                    params=dict(stdin=1, stdout=1, stderr=1, stream=1)
+                )
+                container.start()
+                return Benchmarker.communicate(
+                    socketIO, stdin, stdout, stderr, timeout, self.maxOutputBytes
+                )
+            except TimeoutError:
+                raise Benchmarker.TimedOut
+            finally:
+                job.detach()
+                Benchmarker.remove(container)
+
+        # pooled containers are shared between jobs, so pin the process instead
+        command = ["sh", "-c", shellCommand]
+        if cpus is not None:
+            command = ["taskset", "-c", cpus, *command]
+
+        with self.pool.lease() as member:
+            # a killed member fails its next health check and is replaced
+            job.attach(member.container)
+            try:
+                execId = self.client.api.exec_create(
+                    member.container.id,
+                    command,
+                    stdin=True,
+                    workdir="/usr/src",
+                )["Id"]
+                socketIO = self.client.api.exec_start(execId, socket=True)
+                return Benchmarker.communicate(
+                    socketIO, stdin, stdout, stderr, timeout, self.maxOutputBytes
+                )
+            except TimeoutError:
+                # the member fails its next health check and is replaced
+                Benchmarker.kill(member.container)
+                raise Benchmarker.TimedOut
+            finally:
+                job.detach()
+
+    @staticmethod
+    def kill(container):
+        try:
+            container.kill()
+        except (APIError, NotFound):
+            pass
+
+    @staticmethod
+    def remove(container):
+        try:
+            container.remove(force=True)
+        except (APIError, NotFound):
+            pass
+
+    @staticmethod
+    def timedOutOutput(failMsg: str) -> Output:
+        return Benchmarker.Output(
+            stdout="", stderr=f"{Benchmarker.timeoutMsg}\n{failMsg}\n"
+        )
+
+    @staticmethod
+    def compileFlags(optimized: bool, precompiled: bool = False) -> tuple[str, ...]:
+        optLevel = "O3" if optimized else "O0"
+        flags = ("-w --std=c++17", f"-{optLevel}")
+        if precompiled:
+            flags += (f"-include {Benchmarker.pchTemplate.format(optLevel=optLevel)}",)
+        return flags
+
+    def configHash(self, code: str, optimized: bool = True) -> str:
+        """
+        hash of everything that determines a benchmark result of code,
+        results with equal hashes are interchangeable
+        """
+        config = dict(
+            flags=Benchmarker.compileFlags(optimized),
+            nanobenchOptions=asdict(self.nanobenchOptions),
+            engine=self.engine,
+            imageDigest=self.imageDigest,
+        )
+        h = hashlib.sha256()
+        for part in (code, json.dumps(config, sort_keys=True)):
+            h.update(part.encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def limitsHash(self) -> str:
+        """
+        hash of the limits, a result that hit one of them only stands for
+        the same limits (see utils.getCompletedHashes)
+        """
+        limits = json.dumps(asdict(self.limits), sort_keys=True)
+        return hashlib.sha256(limits.encode()).hexdigest()
+
+    def coveredByPch(self, code: str) -> bool:
+        return bool(self.pchIncludes) and self.pchIncludes.issuperset(
+            map(normalizeInclude, re.findall(includeRegex, code))
+        )
+
+    def compile(
+        self,
+        code: str,
+        optimized: bool = True,
+        cpus: str | None = None,
+        job: Job | None = None,
+    ) -> Build:
+        if self.coveredByPch(code):
+            build = self.compileWith(
+                code, Benchmarker.compileFlags(optimized, precompiled=True), cpus, job
+            )
+            # headers pulled in by the pch can clash with snippet definitions
+            if build.compiled:
+                return build
+        return self.compileWith(code, Benchmarker.compileFlags(optimized), cpus, job)
+
+    def compileWith(
+        self,
+        code: str,
+        flags: tuple[str, ...],
+        cpus: str | None = None,
+        job: Job | None = None,
+    ) -> Build:
+        key = BinaryCache.key(code, flags, self.imageDigest)
+        if self.cache.lookup(key):
+            return Benchmarker.Build(
+                key=key,
+                output=Benchmarker.Output(stdout="", stderr=""),
+                compiled=True,
+                cached=True,
+            )
+
+        # build into a scratch directory and move it into place so that
+        # concurrent builds of the same key never expose a partial binary
+        buildDir = f"{Benchmarker.buildMount}/{key}"
+        scratchDir = f"{buildDir}.{uuid.uuid4().hex}"
+
         compileCommand = (
             "g++",
-            "-w --std=c++17",
-            "-O3" if optimized else "-O0",
+            *flags,
             "nanobench.o",
             "-x c++ -",
-            "-o a.out",
+            f"-o {scratchDir}/{BinaryCache.binaryName}",
         )
 
         shellCommand = "; ".join(
             (
-                " ".join(compileCommand),
-                "exitCode=$?",
-                "if [ $exitCode -ne 0 ]",
-                f'then echo \\"{Benchmarker.compFailMsg}\\" 1>&2; exit 1',
-                "fi",
-                "./a.out",
-                "exitCode=$?",
-                "if [ $exitCode -ne 0 ]",
-                f'then echo \\"{Benchmarker.execFailMsg}\\" 1>&2; exit 1',
-                "fi",
+                f"mkdir -p {scratchDir}",
+                "( "
+                + self.limitCommand(
+                    " ".join(compileCommand),
+                    self.limits.compileTimeout,
+                    Benchmarker.compFailMsg,
+                )
+                + " )",
+                f"if [ $? -ne 0 ]; then rm -rf {scratchDir}; exit 1; fi",
+                # keep entries manageable by the (possibly unprivileged) host user
+                f"chmod -R a+rwX {scratchDir}",
+                f"mv -T {scratchDir} {buildDir} 2>/dev/null || rm -rf {scratchDir}",
             )
         )
 
-        container = self.client.containers.run(
-            self.benchmarkImg,
-            f'sh -c "{shellCommand}"',
-            working_dir="/usr/src",
-            remove=True,
-            detach=True,
-            stdin_open=True,
+        try:
+            output = self.runCommand(
+                shellCommand,
+                stdin=code.encode(),
+                cpus=cpus,
+                job=job,
+                timeout=self.hostTimeout(self.limits.compileTimeout),
+            )
+        except Benchmarker.TimedOut:
+            output = Benchmarker.timedOutOutput(Benchmarker.compFailMsg)
+        build = Benchmarker.Build(
+            key=key,
+            output=output,
+            compiled=Benchmarker.compFailMsg not in output.stderr,
         )
-        socketIO = container.attach_socket(
-            params=dict(stdin=1, stdout=1, stderr=1, stream=1)
+        if build.compiled:
+            self.cache.evict()
+        return build
+
+    def execute(
+        self,
+        build: Build,
+        stdout: bool = True,
+        stderr: bool = True,
+        cpus: str | None = None,
+        job: Job | None = None,
+    ) -> Output:
+        commands = [build.binary]
+        if self.engine == "nanobench" and self.nanobenchOptions.allocations:
+            # counted in a second pass so that the shim stays out of the timed one
+            commands.append(
+                f"env LD_PRELOAD={Benchmarker.mallocCountLib} {build.binary}"
+            )
+        if self.engine == "callgrind":
+            # the counts are parsed from the summary on stderr
+            commands = [" ".join((*Benchmarker.callgrindCommand, build.binary))]
+            stderr = True
+
+        shellCommand = "; ".join(
+            self.limitCommand(
+                command, self.limits.executeTimeout, Benchmarker.execFailMsg
+            )
+            for command in commands
         )
-        sock = socketIO._sock
-        sock.sendall(code.encode())
-        sock.shutdown(socket.SHUT_WR)
-        return Benchmarker.readStreamsFromSock(sock, stdout=stdout, stderr=stderr)
+        try:
+            output = self.runCommand(
+                shellCommand,
+                stdout=stdout,
+                stderr=stderr,
+                cpus=cpus,
+                job=job,
+                timeout=self.hostTimeout(self.limits.executeTimeout * len(commands)),
+            )
+        except Benchmarker.TimedOut:
+            output = Benchmarker.timedOutOutput(Benchmarker.execFailMsg)
+        if self.engine == "callgrind" and Benchmarker.execFailMsg not in output.stderr:
+            # report the counts as a record like the nanobench output
+            record = dict(
+                name="test", callgrind=Benchmarker.parseCallgrind(output.stderr)
+            )
+            output.stderr += json.dumps(record) + "\n"
+        return output
+
+    def profile(
+        self,
+        build: Build,
+        profiler: Profiler = "perf",
+        frequency: int = 999,
+        cpus: str | None = None,
+        job: Job | None = None,
+    ) -> Output:
+        """
+        run a build once more under profiler, stdout is the perf script output
+        (sampled frequency times per second, see foldPerfScript) or the
+        callgrind_annotate function table (see parseCallgrindAnnotate);
+        callgrind is meant for builds of renderCallgrindTemplate, a nanobench
+        program runs far too long under it and mostly profiles nanobench
+        """
+        match profiler:
+            case "perf":
+                # dwarf unwinding works without frame pointers
+                command = (
+                    "perf record --quiet --call-graph dwarf "
+                    f"-F {frequency} -o /tmp/perf.data -- {build.binary}"
+                )
+                report = "perf script -i /tmp/perf.data 2>/dev/null"
+            case "callgrind":
+                command = (
+                    "valgrind --tool=callgrind --callgrind-out-file=/tmp/callgrind.out "
+                    f"{build.binary}"
+                )
+                report = "callgrind_annotate --auto=no /tmp/callgrind.out"
+            case _:
+                raise ValueError(f"Unknown profiler {profiler}")
+
+        shellCommand = "; ".join(
+            (
+                "( "
+                + self.limitCommand(
+                    f"{command} > /dev/null 2>&1",
+                    self.limits.executeTimeout,
+                    Benchmarker.execFailMsg,
+                )
+                + " )",
+                "if [ $? -ne 0 ]; then exit 1; fi",
+                report,
+            )
+        )
+        try:
+            return self.runCommand(
+                shellCommand,
+                cpus=cpus,
+                job=job,
+                timeout=self.hostTimeout(self.limits.executeTimeout),
+            )
+        except Benchmarker.TimedOut:
+            return Benchmarker.timedOutOutput(Benchmarker.execFailMsg)
+
+    def run(
+        self,
+        code: str,
+        stdout: bool = True,
+        stderr: bool = True,
+        optimized: bool = True,
+        job: Job | None = None,
+    ) -> Output:
+        build = self.compile(code, optimized=optimized, job=job)
+        if not build.compiled:
+            return build.output
+        return self.execute(build, stdout=stdout, stderr=stderr, job=job)
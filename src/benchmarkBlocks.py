@@ -0,0 +1,47 @@
+"""
+Benchmark for the C++ block extraction used by processResults.benchmarkTasks
+
+Looks up the `namespace taskN` and `// Task N` blocks of all 50 tasks of the
+agent edited test files, once with a character loop per lookup
+(codeProcessing.extractBlock) and once from a single scan (BlockIndex).
+
+# Usage:
+python benchmarkBlocks.py
+"""
+
+import time
+from pathlib import PosixPath as Path
+from codeProcessing import BlockIndex, extractBlock
+from processResults import restoreAgentEdits
+
+
+def lookupsLegacy(code: str):
+    for taskNum in range(1, 51):
+        extractBlock(code, blockPreamble=f"namespace task{taskNum} ")
+        extractBlock(code, blockPreamble=f"// Task {taskNum}\n")
+
+
+def lookups(code: str):
+    blocks = BlockIndex(code)
+    for taskNum in range(1, 51):
+        blocks.namespace(taskNum)
+        blocks.task(taskNum)
+
+
+def measure(func, code: str, repeat: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(code)
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+    for chatLog in sorted(Path("chat-logs").glob("test*/*.md")):
+        code = restoreAgentEdits(chatLog)
+        legacy = measure(lookupsLegacy, code)
+        current = measure(lookups, code)
+        print(
+            f"{str(chatLog):>40} ({len(code) / 1024:5.1f} KiB): "
+            f"legacy {legacy * 1e3:7.2f} ms, current {current * 1e3:7.2f} ms, "
+            f"{legacy / current:5.1f}x"
+        )
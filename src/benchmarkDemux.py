@@ -0,0 +1,97 @@
+"""
+Micro-benchmark for Benchmarker.readStreamsFromSock
+
+Feeds multi-MB docker-style multiplexed output (as produced by chatty
+examples) through a socket pair and compares the throughput and the amount
+of recovered output of the previous demultiplexer with the current one.
+
+# Usage:
+python benchmarkDemux.py
+"""
+
+import socket
+import struct
+import threading
+import time
+from benchmark import Benchmarker
+
+
+def readStreamsFromSockLegacy(sock, stdout=True, stderr=True) -> Benchmarker.Output:
+    # previous implementation, kept for comparison
+    buffers = [None, b"", b""]
+
+    streams = 0b00
+    streams |= stdout
+    streams |= stderr << 1
+
+    while True:
+        header = sock.recv(8)
+        if len(header) < 8:
+            break
+        (streamID, *_) = struct.unpack(">B", header[0:1])
+        (payloadLen, *_) = struct.unpack(">I", header[4:8])
+        if payloadLen > 0 and len(payload := sock.recv(payloadLen)) == payloadLen:
+            if streamID & streams:
+                buffers[streamID] += payload
+        else:
+            break
+    return Benchmarker.Output(
+        stdout=buffers[1].decode(errors="ignore"),
+        stderr=buffers[2].decode(errors="ignore"),
+    )
+
+
+def makeStream(totalBytes: int, frameSize: int) -> bytes:
+    line = b"0123456789 chatty example output line\n"
+    payload = (line * (frameSize // len(line) + 1))[:frameSize]
+    frames = []
+    for i in range(totalBytes // frameSize):
+        streamID = 2 if i % 16 == 15 else 1
+        frames.append(struct.pack(">BxxxI", streamID, len(payload)) + payload)
+    return b"".join(frames)
+
+
+def measure(demux, stream: bytes) -> tuple[float, int]:
+    reader, writer = socket.socketpair()
+
+    def write():
+        try:
+            writer.sendall(stream)
+            writer.shutdown(socket.SHUT_WR)
+        except OSError:
+            # the reader gave up early
+            pass
+
+    thread = threading.Thread(target=write)
+    start = time.perf_counter()
+    thread.start()
+    output = demux(reader)
+    elapsed = time.perf_counter() - start
+    reader.close()
+    thread.join()
+    writer.close()
+    return elapsed, len(output.stdout) + len(output.stderr)
+
+
+# the legacy demultiplexer is quadratic, only run it on streams with few frames
+LEGACY_MAX_FRAMES = 2048
+
+if __name__ == "__main__":
+    for totalMB in (1, 8, 32):
+        for frameSize in (4 * 1024, 64 * 1024, 1024 * 1024):
+            stream = makeStream(totalMB * 1024 * 1024, frameSize)
+            frameCount = len(stream) // (frameSize + 8)
+            expected = len(stream) - 8 * frameCount
+            for name, demux in (
+                ("legacy", readStreamsFromSockLegacy),
+                ("current", Benchmarker.readStreamsFromSock),
+            ):
+                legacy = demux is readStreamsFromSockLegacy
+                if legacy and frameCount > LEGACY_MAX_FRAMES:
+                    continue
+                elapsed, received = measure(demux, stream)
+                print(
+                    f"{name:>8} {totalMB:>3} MB, {frameSize:>8} B frames: "
+                    f"{received / elapsed / 1e6:8.1f} MB/s, "
+                    f"{received / expected:6.1%} of output received"
+                )
@@ -0,0 +1,173 @@
+"""
+Benchmark for the evaluation table rendering
+
+Builds a test result table for a synthetic evaluation of many models over
+many tasks and compares the render time of the previous cell by cell
+formatting with the current column-wise one.
+
+# Usage:
+python benchmarkTables.py
+"""
+
+import time
+from typing import Iterable, Literal
+import numpy as np
+from pint import UnitRegistry
+from evaluateResults import (
+    Col,
+    ModelTestResult,
+    QtyFmt,
+    Table,
+    bad,
+    buildTestResultTable,
+    colormapRedGreen,
+    fmtBool,
+    fmtImprovement,
+    getColorName,
+    good,
+)
+
+
+# previous implementation, kept for comparison
+class ColLegacy(Col):
+    def __init__(self, name: str, rows: Iterable[str], colType: str):
+        self.name = name
+        self.rows = iter(rows)
+        self.colType = colType
+        self.borders = 0b00
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.rows)
+
+
+def trfImprovementLegacy(
+    improvement: Literal["y", "n", "~"],
+    taskIsFast: Literal[0, 1],
+) -> str:
+    cellWrapper = "%(content)s"
+    colorName = ""
+    if not taskIsFast:
+        cellWrapper = r"\cc{%(colorName)s}{%(content)s}"
+        if improvement == "n":
+            colorName = bad
+        elif improvement == "y":
+            colorName = good
+    return cellWrapper % dict(
+        content=fmtImprovement(improvement),
+        colorName=colorName,
+    )
+
+
+def trfRuntimePropLegacy(
+    runtimeProp: float,
+    runtimePropMapped: float,
+    taskIsFast: Literal[0, 1],
+) -> str:
+    cellWrapper = "%(content)s"
+    if taskIsFast and (-0.1 < runtimeProp and runtimeProp < 0.1):
+        return QtyFmt.fmt(runtimeProp)
+
+    colorName = getColorName(runtimePropMapped, colormapRedGreen)
+    if colorName is not None:
+        cellWrapper = r"\cc{%(colorName)s}{%(content)s}"
+    return cellWrapper % dict(content=QtyFmt.fmt(runtimeProp), colorName=colorName)
+
+
+def buildTestResultTableLegacy(
+    testNum: int,
+    exampleTitles: tuple[str, ...],
+    testTaskIsFastInfo: tuple[Literal[0, 1], ...],
+    runtimesFast: np.ndarray,
+    runtimesSlow: np.ndarray,
+    modelTestResults: dict[str, ModelTestResult],
+) -> Table:
+    ureg = UnitRegistry()
+    cols = [
+        ColLegacy("Example / Task", map(str, range(1, len(exampleTitles) + 1)), "r"),
+        ColLegacy("ex.title", exampleTitles, "l"),
+        ColLegacy(
+            "ex.codeFast.rt (:= bl)",
+            map(lambda t: "{0:.0f~#Lx}".format(t * ureg.second), runtimesFast),
+            "r",
+        ),
+        ColLegacy(
+            "ex.codeSlow.log10(rt/bl)",
+            map(QtyFmt.fmt, np.log10(runtimesSlow / runtimesFast)),
+            "r",
+        ),
+        ColLegacy(
+            f"test{testNum}.task.isSlow",
+            map(lambda isFast: fmtBool(not isFast), testTaskIsFastInfo),
+            "c",
+        ),
+    ]
+    for model, testResult in modelTestResults.items():
+        runtimeProps = np.log10(testResult.runtimes / runtimesFast)
+        runtimePropsMapped = np.atan(runtimeProps) / (np.pi / 2)
+        cols.append(
+            ColLegacy(
+                f"test{testNum}.{model}.improved",
+                map(
+                    trfImprovementLegacy,
+                    testResult.improvedInfo,
+                    testTaskIsFastInfo,
+                ),
+                "c",
+            )
+        )
+        cols.append(
+            ColLegacy(
+                f"test{testNum}.{model}.log10(rt/bl)",
+                map(
+                    trfRuntimePropLegacy,
+                    runtimeProps,
+                    runtimePropsMapped,
+                    testTaskIsFastInfo,
+                ),
+                "r",
+            )
+        )
+    return Table(*cols, rowLines=True)
+
+
+def makeEvaluation(nModels: int, nTasks: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    runtimesFast = rng.lognormal(-9, 1, nTasks)
+    return dict(
+        testNum=1,
+        exampleTitles=tuple(f"Example {i}" for i in range(1, nTasks + 1)),
+        testTaskIsFastInfo=tuple(map(int, rng.integers(0, 2, nTasks))),
+        runtimesFast=runtimesFast,
+        runtimesSlow=runtimesFast * rng.lognormal(1, 1, nTasks),
+        modelTestResults={
+            f"model-{m}": ModelTestResult(
+                improvedInfo=list(rng.choice(["y", "n", "~"], nTasks)),
+                runtimes=runtimesFast * rng.lognormal(0, 1, nTasks),
+            )
+            for m in range(nModels)
+        },
+    )
+
+
+def measure(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    for nModels, nTasks in ((4, 50), (100, 1000)):
+        evaluation = makeEvaluation(nModels, nTasks)
+        legacy, _ = measure(lambda: buildTestResultTableLegacy(**evaluation).render())
+        current, (table, _) = measure(lambda: buildTestResultTable(**evaluation))
+        latex, _ = measure(table.render)
+        csv, _ = measure(table.renderCsv)
+        print(
+            f"{nModels:>4} models x {nTasks:>5} tasks: "
+            f"legacy {legacy:7.3f} s, "
+            f"current build {current:7.3f} s + LaTeX {latex:7.3f} s, "
+            f"CSV {csv:7.3f} s"
+        )
@@ -0,0 +1,69 @@
+from __future__ import annotations
+import hashlib
+import os
+import shutil
+import threading
+from pathlib import PosixPath as Path
+
+
+class BinaryCache:
+    """
+    Content-addressed store of compiled benchmark binaries.
+    Every entry is a directory <root>/<key> holding the binary, where key is the
+    hash of everything that influences the build output. Entries are evicted
+    least recently used first once the cache exceeds maxBytes.
+    """
+
+    binaryName = "a.out"
+
+    def __init__(self, root: str, maxBytes: int = 2 * 1024**3):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.maxBytes = maxBytes
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(source: str, flags: tuple[str, ...], imageDigest: str) -> str:
+        h = hashlib.sha256()
+        for part in (source, "\0".join(flags), imageDigest):
+            h.update(part.encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def binaryPath(self, key: str) -> Path:
+        return self.root / key / BinaryCache.binaryName
+
+    def lookup(self, key: str) -> bool:
+        binary = self.binaryPath(key)
+        try:
+            # mtime doubles as the last access time for eviction
+            os.utime(binary)
+        except (FileNotFoundError, PermissionError):
+            return binary.is_file()
+        return True
+
+    @staticmethod
+    def entrySize(entry: Path) -> int:
+        return sum(
+            os.path.getsize(os.path.join(dirPath, name))
+            for dirPath, _, names in os.walk(entry)
+            for name in names
+        )
+
+    def evict(self):
+        with self.lock:
+            entries = []
+            for entry in self.root.iterdir():
+                binary = entry / BinaryCache.binaryName
+                if not binary.is_file():
+                    continue
+                entries.append(
+                    (binary.stat().st_mtime, BinaryCache.entrySize(entry), entry)
+                )
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry in sorted(entries):
+                if total <= self.maxBytes:
+                    break
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
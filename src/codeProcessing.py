@@ -1,8 +1,8 @@
 import re
-from benchmark import Benchmarker
+import string
+from benchmark import Benchmarker, includeRegex
 from dataclasses import dataclass
 
-includeRegex = re.compile(r"#include[^\n]*")
 commentRegex = re.compile(r"\/\/[^\n]*")
 
 
@@ -49,10 +49,105 @@ def extractBlock(code: str, blockPreamble: str) -> CodeBlock:
     )
 
 
+# tokens that matter for brace matching, literals and comments are matched
+# as a whole so that braces inside them are skipped
+# every alternative starts with a plain character outside of its group, which
+# lets the regex engine skip to candidate positions without trying each one
+tokenRegex = re.compile(
+    r"""R(?P<rawString>"(?P<delimiter>[^()\\\s]{0,16})\(.*?\)(?P=delimiter)")"""
+    r"""|"(?P<string>(?:\\.|[^"\\\n])*")"""
+    r"""|'(?P<char>(?:\\.|[^'\\\n])*')"""
+    r"|/(?P<taskComment>/\s*Task\s+(?P<taskNum>\d+)[ \t]*$)"
+    r"|/(?P<lineComment>/[^\n]*)"
+    r"|/(?P<blockComment>\*.*?\*/)"
+    r"|n(?P<namespace>amespace\s+task(?P<namespaceNum>\d+)\b)"
+    r"|i(?P<main>nt\s+main\b)"
+    r"|\{(?P<open>)"
+    r"|\}(?P<close>)"
+    r"|;(?P<semicolon>)",
+    flags=re.DOTALL | re.MULTILINE,
+)
+
+
+usingRegex = re.compile(r"\busing\s+$")
+
+
+def isWordChar(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+class BlockIndex:
+    """
+    Locations of the `// Task N` blocks, `namespace taskN` blocks and the
+    `int main` function of a C++ source, found in a single scan.
+    Braces in string, character and raw string literals and in comments are
+    ignored. A marker owns the next block opened after it unless a `;` ends
+    its statement first (`using namespace taskN;`, `int main();`), the first
+    block per marker wins. Missing blocks are reported as CodeBlock(0, 0, 0, 0)
+    like extractBlock does.
+    """
+
+    missing = CodeBlock(0, 0, 0, 0)
+
+    def __init__(self, code: str):
+        self.blocks: dict[tuple[str, int], CodeBlock] = dict()
+
+        marker: tuple[tuple[str, int], int] | None = None
+        # (marker of the block or None, position of the opening brace)
+        stack: list[tuple[tuple[tuple[str, int], int] | None, int]] = []
+        pos = 0
+        while (match := tokenRegex.search(code, pos)) is not None:
+            pos = match.end()
+            start = match.start()
+            preceding = code[start - 1] if start > 0 else ""
+            match match.lastgroup:
+                case "char" if preceding and preceding in string.hexdigits:
+                    # digit separator (1'000'000), not a character literal
+                    pos = start + 1
+                case "namespace" | "main" if isWordChar(preceding):
+                    # part of a longer identifier
+                    pos = start + 1
+                case "namespace" if usingRegex.search(code, max(start - 16, 0), start):
+                    pass
+                case "taskComment":
+                    marker = (("task", int(match["taskNum"])), start)
+                case "namespace":
+                    marker = (("namespace", int(match["namespaceNum"])), start)
+                case "main":
+                    marker = (("main", 0), start)
+                case "open":
+                    stack.append((marker, start))
+                    marker = None
+                case "semicolon":
+                    marker = None
+                case "close" if stack:
+                    blockMarker, openPos = stack.pop()
+                    if blockMarker is not None:
+                        key, blockStart = blockMarker
+                        self.blocks.setdefault(
+                            key,
+                            CodeBlock(
+                                start=blockStart,
+                                end=match.end(),
+                                bodyStart=openPos + 1,
+                                bodyEnd=start,
+                            ),
+                        )
+
+    def task(self, num: int) -> CodeBlock:
+        return self.blocks.get(("task", num), BlockIndex.missing)
+
+    def namespace(self, num: int) -> CodeBlock:
+        return self.blocks.get(("namespace", num), BlockIndex.missing)
+
+    def main(self) -> CodeBlock:
+        return self.blocks.get(("main", 0), BlockIndex.missing)
+
+
 def extract(code: str) -> Benchmarker.Code:
     includes = [s.strip() for s in re.findall(includeRegex, code)]
 
-    mainInfo = extractBlock(code, blockPreamble="int main")
+    mainInfo = BlockIndex(code).main()
 
     mainBody = code[mainInfo.bodyStart : mainInfo.bodyEnd]
     mainBody = mainBody.replace("return 0;", "")
@@ -0,0 +1,112 @@
+from __future__ import annotations
+import queue
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator
+from docker import DockerClient
+from docker.errors import APIError, NotFound
+from docker.models.containers import Container
+
+
+class ContainerPool:
+    """
+    Set of long-lived benchmark containers that jobs are dispatched into via exec.
+    A container is replaced when it fails its health check or after it has
+    served `recycleAfter` jobs.
+    """
+
+    idleCommand = ["sleep", "infinity"]
+
+    @dataclass
+    class Member:
+        container: Container
+        jobs: int = 0
+
+    def __init__(
+        self,
+        client: DockerClient,
+        image: str,
+        size: int,
+        recycleAfter: int = 100,
+        containerOptions: dict | None = None,
+    ):
+        assert size > 0
+        self.client = client
+        self.image = image
+        self.size = size
+        self.recycleAfter = recycleAfter
+        self.containerOptions = containerOptions or dict()
+        self.idle: queue.Queue[ContainerPool.Member] = queue.Queue()
+        self.members: list[ContainerPool.Member] = []
+        self.lock = threading.Lock()
+        self.closed = False
+
+        for _ in range(size):
+            self.idle.put(self.spawn())
+
+    def spawn(self) -> Member:
+        container = self.client.containers.run(
+            self.image,
+            ContainerPool.idleCommand,
+            detach=True,
+            remove=True,
+            **self.containerOptions,
+        )
+        member = ContainerPool.Member(container)
+        with self.lock:
+            self.members.append(member)
+        return member
+
+    def retire(self, member: Member):
+        with self.lock:
+            if member in self.members:
+                self.members.remove(member)
+        try:
+            member.container.kill()
+        except (APIError, NotFound):
+            pass
+
+    @staticmethod
+    def healthy(member: Member) -> bool:
+        try:
+            member.container.reload()
+        except (APIError, NotFound):
+            return False
+        return member.container.status == "running"
+
+    def acquire(self) -> Member:
+        if self.closed:
+            raise RuntimeError("Container pool is closed")
+        member = self.idle.get()
+        if member.jobs >= self.recycleAfter or not ContainerPool.healthy(member):
+            self.retire(member)
+            try:
+                member = self.spawn()
+            except BaseException:
+                # keep the slot, the next acquire retries the replacement
+                self.idle.put(member)
+                raise
+        return member
+
+    def release(self, member: Member):
+        member.jobs += 1
+        if self.closed:
+            self.retire(member)
+        else:
+            self.idle.put(member)
+
+    @contextmanager
+    def lease(self) -> Iterator[Member]:
+        member = self.acquire()
+        try:
+            yield member
+        finally:
+            self.release(member)
+
+    def close(self):
+        self.closed = True
+        with self.lock:
+            members = list(self.members)
+        for member in members:
+            self.retire(member)
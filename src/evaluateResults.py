@@ -1,10 +1,15 @@
+import base64
+import csv
+import functools
+import io
 import json
 import re
+import warnings
 from IPython.display import display, Markdown, clear_output
-from utils import getExamplesSorted, Example, DB, starmap
+from utils import getExamplesSorted, Example, DB
 from processResults import fullDiffRegex
 from pathlib import PosixPath as Path
-from typing import Literal, Iterator, Iterable
+from typing import Literal, Iterator, Iterable, get_args
 import pandas as pd
 import numpy as np
 from dataclasses import dataclass
@@ -167,50 +172,65 @@ def getColorName(
     return result
 
 
-def getBenchRuntimesSorted(
+def getColorNames(
+    vals: np.ndarray,
+    cmap: tuple[tuple[str, float, float, str]],
+) -> np.ndarray:
+    """
+    vectorized getColorName for a colormap of adjacent ranges,
+    "" where no color applies
+    """
+    names = np.array([colorName for colorName, *_ in cmap])
+    edges = np.array([cmap[0][1], *(max for _, _, max, _ in cmap)])
+    assert all(cmap[i][2] == cmap[i + 1][1] for i in range(len(cmap) - 1))
+
+    # bin i covers (edges[i - 1], edges[i]], the lowest edge belongs to the first bin
+    bins = np.digitize(vals, edges, right=True)
+    bins[vals == edges[0]] = 1
+    valid = (bins >= 1) & (bins <= len(cmap))
+    return np.where(valid, names[np.clip(bins - 1, 0, len(cmap) - 1)], "")
+
+
+Statistic = Literal["runtimeAvg", "runtimeMedian", "runtimeMin"]
+# per benchmark iteration except peakRss, see Benchmarker.NanobenchOptions.allocations
+MemoryMetric = Literal["allocationsPerOp", "bytesAllocatedPerOp", "peakRss"]
+memoryMetricUnits: dict[str, str | None] = dict(
+    allocationsPerOp=None, bytesAllocatedPerOp="byte", peakRss="byte"
+)
+
+
+def getRuntimesSorted(
     optimized: bool,
-    filenameLike: str,
-    filenameReplace: str,
+    filters: dict,
+    statistic: Statistic = "runtimeAvg",
 ) -> list[float]:
-    def fetch() -> Iterator[float]:
-        benchmarkColl = (
-            DB.benchmarksOptimized if optimized else DB.benchmarksUnoptimized
-        )
-        query = (
-            f"for bench in `{benchmarkColl}`",
-            f'  filter bench.filename like "{filenameLike}"',
-            f'  let exampleNum = to_number(regex_replace(bench.filename, "{filenameReplace}", ""))',
-            "  sort exampleNum asc",
-            """
-            return {
-            "exampleNum" : exampleNum, 
-            "runtimeAvg" : bench.runtimeAvg, 
-            }
-            """,
-        )
-        for exampleNum, benchDoc in enumerate(
-            DB.get().aql.execute("\n".join(query)), start=1
-        ):
-            assert exampleNum == benchDoc["exampleNum"]
-            yield benchDoc["runtimeAvg"]
-
-    runtimeData = list(fetch())
-    assert len(runtimeData) == N_EXAMPLES
-    return runtimeData
+    """
+    return runtimes of the results matching filters on the structured result
+    fields (see utils.structuredFields), sorted by example / task number
+    """
+    docs = DB.store().select(
+        DB.results(DB.benchmarks(optimized)),
+        filters,
+        fields=["num", statistic],
+    )
+    docs.sort(key=lambda doc: doc["num"])
+    assert [doc["num"] for doc in docs] == list(range(1, N_EXAMPLES + 1))
+    return [doc.get(statistic, -1.0) for doc in docs]
 
 
 def getExampleRuntimes(
     optimized: bool,
     version: Literal["codeSlow", "codeFast"],
+    statistic: Statistic = "runtimeAvg",
 ) -> list[float]:
     """
     return runtimes in seconds for examples of given version
     returned runtimes are sorted by example number
     """
-    return getBenchRuntimesSorted(
+    return getRuntimesSorted(
         optimized=optimized,
-        filenameLike=f"%.{version}",
-        filenameReplace="[^0-9]*",
+        filters=dict(kind="example", variant=version),
+        statistic=statistic,
     )
 
 
@@ -218,22 +238,233 @@ def getTaskRuntimes(
     optimized: bool,
     model: str,
     testNum: Literal[1, 2],
+    statistic: Statistic = "runtimeAvg",
 ) -> list[float]:
     """
     return runtimes in seconds for tasks in given model test
     returned runtimes are sorted by task number
     """
-    return getBenchRuntimesSorted(
+    return getRuntimesSorted(
         optimized=optimized,
-        filenameLike=f"test{testNum}.{model}.task%",
-        filenameReplace=".*task",
+        filters=dict(kind="task", testNum=testNum, model=model),
+        statistic=statistic,
+    )
+
+
+evaluationCacheDir = Path(".evaluation-cache")
+evaluationColumns = ["kind", "variant", "testNum", "model", "num"]
+# frames by (collection, revision)
+evaluationData: dict[tuple[str, str], pd.DataFrame] = dict()
+
+
+def fetchEvaluationData(collection: str) -> pd.DataFrame:
+    statistics = list(get_args(Statistic))
+    memoryMetrics = list(get_args(MemoryMetric))
+    columns = evaluationColumns + statistics + memoryMetrics
+    docs = DB.store().select(
+        collection,
+        dict(kind=["example", "task"]),
+        fields=columns,
     )
+    data = pd.DataFrame(docs, columns=columns)
+    # missing in results without allocation measurements, -1 if unavailable
+    memory = data[memoryMetrics].astype(float)
+    data[memoryMetrics] = memory.where(memory >= 0)
+    return data.sort_values(evaluationColumns, ignore_index=True)
+
+
+def loadCollectionData(
+    collection: str,
+    revision: str,
+    cacheDir: Path,
+) -> pd.DataFrame:
+    path = cacheDir / f"{collection}.{revision}.parquet"
+    if path.is_file():
+        data = pd.read_parquet(path)
+        # files written before a column was added are refetched
+        if set(get_args(MemoryMetric)).issubset(data.columns):
+            return data
+
+    data = fetchEvaluationData(collection)
+    cacheDir.mkdir(parents=True, exist_ok=True)
+    for stale in cacheDir.glob(f"{collection}.*.parquet"):
+        stale.unlink(missing_ok=True)
+    try:
+        data.to_parquet(path)
+    except ImportError:
+        warnings.warn("No parquet engine installed, evaluation data is not cached")
+    return data
+
+
+def loadEvaluationData(cacheDir: Path = evaluationCacheDir) -> pd.DataFrame:
+    """
+    return all runtime statistics of all examples and tasks of both optimization
+    levels, one row per result with columns optimized, kind, variant, testNum,
+    model, num and one column per Statistic and MemoryMetric (NaN if unavailable)
+    each collection is only queried once per revision, the result is kept in
+    memory and as Parquet file in cacheDir
+    """
+    frames = []
+    for optimized in (True, False):
+        collection = DB.results(DB.benchmarks(optimized))
+        key = (collection, DB.store().revision(collection))
+        if key not in evaluationData:
+            evaluationData[key] = loadCollectionData(*key, cacheDir=cacheDir)
+        frames.append(evaluationData[key].assign(optimized=optimized))
+    return pd.concat(frames, ignore_index=True)
+
+
+def getEvaluationMatrix(
+    optimized: bool,
+    statistic: Statistic = "runtimeAvg",
+    memoryMetric: MemoryMetric | None = None,
+) -> pd.DataFrame:
+    """
+    return the runtimes of all examples and tasks, one row per result
+    with columns kind, variant, testNum, model, num, runtime
+    and memory if memoryMetric is given
+    """
+    data = loadEvaluationData()
+    columns = {statistic: "runtime"}
+    if memoryMetric is not None:
+        columns[memoryMetric] = "memory"
+    return (
+        data[data["optimized"] == optimized][evaluationColumns + list(columns)]
+        .rename(columns=columns)
+        .reset_index(drop=True)
+    )
+
+
+def discoverModels(matrix: pd.DataFrame, testNum: int) -> list[str]:
+    """
+    models with task results for the given test in an evaluation matrix
+    """
+    tasks = matrix[(matrix["kind"] == "task") & (matrix["testNum"] == testNum)]
+    return sorted(tasks["model"].unique())
+
+
+@functools.lru_cache(maxsize=None)
+def loadJsonCached(path: Path, mtime: int):
+    with Path.open(path, "r") as f:
+        return json.load(f)
+
+
+def loadJson(path: Path):
+    """
+    parsed contents of a JSON file, reparsed only if the file changed,
+    the result is shared and must not be modified
+    """
+    return loadJsonCached(path, path.stat().st_mtime_ns)
+
+
+def sliceRuntimes(
+    matrix: pd.DataFrame, column: str = "runtime", **filters
+) -> np.ndarray:
+    """
+    runtimes (or another column) of the rows of an evaluation matrix matching
+    filters, sorted by example / task number
+    """
+    mask = np.ones(len(matrix), dtype=bool)
+    for name, value in filters.items():
+        mask &= (matrix[name] == value).to_numpy()
+    rows = matrix[mask]
+    assert rows["num"].tolist() == list(range(1, len(rows) + 1))
+    return rows[column].to_numpy()
+
+
+def loadSamples(packed: str) -> np.ndarray:
+    """
+    unpack a per epoch sample array stored by utils.packSamples
+    """
+    return np.frombuffer(base64.b64decode(packed), dtype="<f8")
+
+
+def getBenchSamples(
+    optimized: bool,
+    filename: str,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    return per epoch runtimes per iteration in seconds and iteration counts
+    of the benchmark with given filename
+    """
+    bench = DB.store().get(DB.benchmarks(optimized), filename)
+    assert bench is not None
+    return loadSamples(bench["samplesElapsed"]), loadSamples(bench["samplesIterations"])
+
+
+def getProfiles(
+    optimized: bool,
+    testNum: int,
+    model: str,
+    taskNum: int,
+) -> dict[str, dict | None]:
+    """
+    return the profiles (see profileResults.py) of the slow and fast example
+    and of the agent edited task with the given number, None where missing
+    """
+    collection = DB.results(DB.profiles(optimized))
+    filenames = dict(
+        codeSlow=f"{DB.examples}/{taskNum}.codeSlow",
+        codeFast=f"{DB.examples}/{taskNum}.codeFast",
+        agent=f"test{testNum}.{model}.task{taskNum}",
+    )
+    return {
+        variant: DB.store().get(collection, filename)
+        for variant, filename in filenames.items()
+    }
+
+
+def compareProfiles(
+    optimized: bool,
+    testNum: int,
+    model: str,
+    taskNum: int,
+) -> pd.DataFrame:
+    """
+    return the share of the samples of the hot symbols of the slow and fast
+    example and the agent edited task side by side, one row per symbol that
+    is hot in any of them, 0 where it is not and NaN for missing profiles
+    """
+    profiles = getProfiles(optimized, testNum, model, taskNum)
+    shares = {
+        variant: {hot["symbol"]: hot["share"] for hot in profile["hotSymbols"]}
+        for variant, profile in profiles.items()
+        if profile is not None
+    }
+    table = pd.DataFrame(shares, columns=list(profiles))
+    table[list(shares)] = table[list(shares)].fillna(0.0)
+    return table.loc[table.max(axis=1).sort_values(ascending=False).index]
+
+
+def getPairedRatios(optimized: bool, testNum: int) -> pd.DataFrame:
+    """
+    return the runtime ratios of the agent edited tasks to the fast example
+    measured in pairs (see processResults.compareAgentEdits) and the bounds of
+    their confidence intervals, indexed by model and task number, NaN where
+    unavailable
+    """
+    docs = DB.store().select(
+        DB.results(DB.pairs(optimized)),
+        dict(kind="task", testNum=testNum),
+        fields=["model", "num", "pairs", "ratio", "log10RatioLow", "log10RatioHigh"],
+    )
+    table = pd.DataFrame(
+        docs,
+        columns=["model", "num", "pairs", "ratio", "log10RatioLow", "log10RatioHigh"],
+    )
+    table["ratio"] = table["ratio"].where(table["ratio"] > 0)
+    for bound in ("Low", "High"):
+        table[f"ratio{bound}"] = 10 ** table.pop(f"log10Ratio{bound}").astype(float)
+    return table.set_index(["model", "num"]).sort_index()
 
 
 @dataclass
 class ModelTestResult:
-    improvedInfo: list[Literal["y", "n", "~"]]
+    # "" if the model has no review file
+    improvedInfo: list[Literal["y", "n", "~", ""]]
     runtimes: np.ndarray
+    # values of a MemoryMetric, NaN if unavailable
+    memory: np.ndarray | None = None
 
 
 def getModelTestResult(
@@ -241,9 +472,15 @@ def getModelTestResult(
     model: str,
     optimized: bool,
     root: Path,
+    statistic: Statistic = "runtimeAvg",
+    runtimes: np.ndarray | None = None,
+    memory: np.ndarray | None = None,
 ) -> ModelTestResult:
-    with Path.open(root / "evaluation" / f"test{testNum}/{model}.json", "r") as f:
-        evalData = json.load(f)
+    """
+    runtimes are queried unless given, the improvements of a model without a
+    review file are unavailable
+    """
+    reviewPath = root / "evaluation" / f"test{testNum}/{model}.json"
 
     def unpack(taskNum: int, taskInfo: dict) -> Literal["y", "n", "~"]:
         assert taskInfo["taskNum"] == taskNum
@@ -251,28 +488,36 @@ def getModelTestResult(
         assert improved in ("y", "n", "~")
         return improved
 
-    improvedInfo = list(
-        (
-            unpack(taskNum, taskInfo)
-            for taskNum, taskInfo in enumerate(evalData["tasks"], start=1)
+    if runtimes is None:
+        runtimes = np.array(
+            getTaskRuntimes(
+                optimized=optimized,
+                model=model,
+                testNum=testNum,
+                statistic=statistic,
+            )
         )
-    )
 
-    runtimes = np.array(
-        getTaskRuntimes(
-            optimized=optimized,
-            model=model,
-            testNum=testNum,
+    if reviewPath.is_file():
+        improvedInfo = list(
+            (
+                unpack(taskNum, taskInfo)
+                for taskNum, taskInfo in enumerate(
+                    loadJson(reviewPath)["tasks"], start=1
+                )
+            )
         )
-    )
+    else:
+        improvedInfo = [""] * len(runtimes)
 
     return ModelTestResult(
         improvedInfo=improvedInfo,
         runtimes=runtimes,
+        memory=memory,
     )
 
 
-def fmtImprovement(improvement: Literal["y", "n", "~"]) -> str:
+def fmtImprovement(improvement: Literal["y", "n", "~", ""]) -> str:
     match improvement:
         case "y":
             return r"\fc"
@@ -280,6 +525,8 @@ def fmtImprovement(improvement: Literal["y", "n", "~"]) -> str:
             return r"\ec"
         case "~":
             return r"\hc"
+        case "":
+            return "-"
         case _:
             raise ValueError
 
@@ -291,22 +538,20 @@ def fmtBool(val: bool) -> str:
         return r"\ec"
 
 
-def trfImprovement(
-    improvement: Literal["y", "n", "~"],
-    taskIsFast: Literal[0, 1],
-) -> str:
-    cellWrapper = "%(content)s"
-    colorName = ""
-    if not taskIsFast:
-        cellWrapper = r"\cc{%(colorName)s}{%(content)s}"
-        if improvement == "n":
-            colorName = bad
-        elif improvement == "y":
-            colorName = good
-    return cellWrapper % dict(
-        content=fmtImprovement(improvement),
-        colorName=colorName,
-    )
+def trfImprovements(
+    improvedInfo: list[Literal["y", "n", "~", ""]],
+    taskIsFastInfo: Iterable[Literal[0, 1]],
+) -> list[str]:
+    colorNames = dict(n=bad, y=good)
+    return [
+        (
+            fmtImprovement(improvement)
+            if taskIsFast or not improvement
+            else r"\cc{%s}{%s}"
+            % (colorNames.get(improvement, ""), fmtImprovement(improvement))
+        )
+        for improvement, taskIsFast in zip(improvedInfo, taskIsFastInfo)
+    ]
 
 
 class Col:
@@ -319,17 +564,20 @@ class Col:
         rows: Iterable[str],
         colType: str,
         borders: int | None = None,
+        values: Iterable | None = None,
     ):
+        """
+        rows are the rendered LaTeX cells, values the plain data written to CSV
+        (defaults to rows)
+        """
         self.name = name
-        self.rows = iter(rows)
+        self.rows = list(rows)
         self.colType = colType
         self.borders = borders if borders is not None else 0b00
+        self.values = list(values) if values is not None else self.rows
 
     def __iter__(self):
-        return self
-
-    def __next__(self):
-        return next(self.rows)
+        return iter(self.rows)
 
 
 commands = r"""
@@ -403,68 +651,88 @@ class Table:
     def render(self) -> str:
         return "\n".join(self.lines())
 
+    def renderCsv(self) -> str:
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(col.name for col in self.cols)
+        writer.writerows(zip(*(col.values for col in self.cols)))
+        return out.getvalue()
+
 
 class QtyFmt:
     @staticmethod
     def fmt(val: float) -> str:
         return "{0:.1f}".format(x if (x := round(val, 1)) != 0 else 0.0)
 
+    @staticmethod
+    def fmtArray(vals: np.ndarray) -> np.ndarray:
+        vals = np.asarray(vals, dtype=float)
+        # no "-0.0"
+        return np.char.mod("%.1f", np.where(np.round(vals, 1) == 0, 0.0, vals))
+
+
+def trfRuntimeProps(
+    runtimeProps: np.ndarray,
+    runtimePropsMapped: np.ndarray,
+    taskIsFastInfo: Iterable[Literal[0, 1]],
+) -> list[str]:
+    content = QtyFmt.fmtArray(runtimeProps)
+    colorNames = getColorNames(runtimePropsMapped, colormapRedGreen)
+    taskIsFast = np.fromiter(taskIsFastInfo, dtype=bool, count=len(content))
+    plain = (taskIsFast & (np.abs(runtimeProps) < 0.1)) | (colorNames == "")
+    colored = np.char.add(
+        np.char.add(np.char.add(r"\cc{", colorNames), "}{"), np.char.add(content, "}")
+    )
+    return np.where(plain, content, colored).tolist()
 
-def trfRuntimeProp(
-    runtimeProp: float,
-    runtimePropMapped: float,
-    taskIsFast: Literal[0, 1],
-) -> str:
-    cellWrapper = "%(content)s"
-    if taskIsFast and (-0.1 < runtimeProp and runtimeProp < 0.1):
-        return QtyFmt.fmt(runtimeProp)
 
-    colorName = getColorName(runtimePropMapped, colormapRedGreen)
-    if colorName is not None:
-        cellWrapper = r"\cc{%(colorName)s}{%(content)s}"
-    return cellWrapper % dict(content=QtyFmt.fmt(runtimeProp), colorName=colorName)
+def fmtMemory(values: np.ndarray, memoryMetric: MemoryMetric) -> list[str]:
+    unit = memoryMetricUnits[memoryMetric]
+    ureg = UnitRegistry()
+    return [
+        (
+            "--"
+            if np.isnan(value)
+            else (
+                QtyFmt.fmt(value)
+                if unit is None
+                else "{0:.0f~#Lx}".format(value * ureg(unit))
+            )
+        )
+        for value in values
+    ]
 
 
-def makeTestResultTable(
-    testNum: int,
-    optimized: bool,
-    root: Path = Path.cwd(),
-) -> tuple[Table, pd.DataFrame]:
-    models = (
-        "claude-sonnet-4",
-        "gemini-2.5-pro",
-        "gpt-4o",
-        "o4-mini",
+def trfMemoryProps(
+    memoryProps: np.ndarray,
+    taskIsFastInfo: Iterable[Literal[0, 1]],
+) -> list[str]:
+    cells = trfRuntimeProps(
+        memoryProps, np.atan(memoryProps) / (np.pi / 2), taskIsFastInfo
     )
+    return ["--" if np.isnan(prop) else cell for prop, cell in zip(memoryProps, cells)]
 
-    with Path.open(root / "evaluation" / "titles.json", "r") as f:
-        exampleTitles = tuple(json.load(f))
-    with Path.open(root / f"info{testNum}.json", "r") as f:
-        testInfo = json.load(f)
-        testTaskIsFastInfo = tuple(testInfo["choices"])
-
-    runtimesBaseline = runtimesFast = np.array(
-        getExampleRuntimes(
-            optimized=optimized,
-            version="codeFast",
-        )
-    )
-    runtimesSlow = np.array(
-        getExampleRuntimes(
-            optimized=optimized,
-            version="codeSlow",
-        )
-    )
 
-    modelTestResults = {
-        model: getModelTestResult(
-            testNum,
-            model=model,
-            optimized=optimized,
-            root=root,
-        )
-        for model in models
-    }
+def buildTestResultTable(
+    testNum: int,
+    exampleTitles: tuple[str, ...],
+    testTaskIsFastInfo: tuple[Literal[0, 1], ...],
+    runtimesFast: np.ndarray,
+    runtimesSlow: np.ndarray,
+    modelTestResults: dict[str, ModelTestResult],
+    memoryFast: np.ndarray | None = None,
+    memoryMetric: MemoryMetric | None = None,
+) -> tuple[Table, pd.DataFrame]:
+    """
+    render the result table of a test for any number of models and tasks,
+    cells are formatted and colored column-wise
+    memoryFast adds the memoryMetric of the fast examples as second baseline
+    and the ratio of every model to it, counted +1 so that zero allocations
+    compare
+    """
+    runtimesBaseline = runtimesFast
+    nTasks = len(exampleTitles)
+    withMemory = memoryFast is not None and memoryMetric is not None
 
     def trfModelTestResult(
         model: str,
@@ -476,22 +744,27 @@ def makeTestResultTable(
 
         yield Col(
             f"test{testNum}.{model}.improved",
-            starmap(
-                trfImprovement,
-                zip(testResult.improvedInfo, testTaskIsFastInfo),
-            ),
+            trfImprovements(testResult.improvedInfo, testTaskIsFastInfo),
             colType="c",
+            values=testResult.improvedInfo,
         )
 
         yield Col(
             f"test{testNum}.{model}.log10(rt/bl)",
-            starmap(
-                trfRuntimeProp,
-                zip(runtimeProps, runtimePropsMapped, testTaskIsFastInfo),
-            ),
+            trfRuntimeProps(runtimeProps, runtimePropsMapped, testTaskIsFastInfo),
             colType="r",
+            values=runtimeProps,
         )
 
+        if withMemory:
+            memoryProps = np.log10((testResult.memory + 1) / (memoryFast + 1))
+            yield Col(
+                f"test{testNum}.{model}.log10({memoryMetric}/mbl)",
+                trfMemoryProps(memoryProps, testTaskIsFastInfo),
+                colType="r",
+                values=memoryProps,
+            )
+
     ureg = UnitRegistry()
     trfdRuntimesFast = list(
         map(
@@ -519,24 +792,48 @@ def makeTestResultTable(
             for k, v in d.items()
         },
     )
+    if withMemory:
+        df[f"ex.codeFast.{memoryMetric}"] = memoryFast
+        for model, testResults in modelTestResults.items():
+            df[f"test{testNum}.{model}.{memoryMetric}"] = testResults.memory
 
+    runtimePropsSlow = np.log10(runtimesSlow / runtimesBaseline)
     tab = Table(
         Col(
             "Example / Task",
-            map(str, range(1, N_EXAMPLES + 1)),
+            map(str, range(1, nTasks + 1)),
             colType="r",
         ),
         Col("ex.title", exampleTitles, colType="l"),
-        Col("ex.codeFast.rt (:= bl)", trfdRuntimesFast, colType="r"),
+        Col(
+            "ex.codeFast.rt (:= bl)",
+            trfdRuntimesFast,
+            colType="r",
+            values=runtimesFast,
+        ),
         Col(
             "ex.codeSlow.log10(rt/bl)",
-            map(QtyFmt.fmt, np.log10(runtimesSlow / runtimesBaseline)),
+            QtyFmt.fmtArray(runtimePropsSlow).tolist(),
             colType="r",
+            values=runtimePropsSlow,
         ),
         Col(
             f"test{testNum}.task.isSlow",
             map(lambda isFast: fmtBool(not isFast), testTaskIsFastInfo),
             colType="c",
+            values=(not isFast for isFast in testTaskIsFastInfo),
+        ),
+        *(
+            (
+                Col(
+                    f"ex.codeFast.{memoryMetric} (:= mbl)",
+                    fmtMemory(memoryFast, memoryMetric),
+                    colType="r",
+                    values=memoryFast,
+                ),
+            )
+            if withMemory
+            else ()
         ),
         *(
             col
@@ -547,3 +844,62 @@ def makeTestResultTable(
     )
 
     return (tab, df)
+
+
+def makeTestResultTable(
+    testNum: int,
+    optimized: bool,
+    root: Path = Path.cwd(),
+    statistic: Statistic = "runtimeAvg",
+    models: list[str] | None = None,
+    memoryMetric: MemoryMetric | None = None,
+) -> tuple[Table, pd.DataFrame]:
+    """
+    models defaults to all models with results for the test, those without
+    a review file are listed without improvements,
+    memoryMetric adds its columns (see buildTestResultTable)
+    """
+    exampleTitles = tuple(loadJson(root / "evaluation" / "titles.json"))
+    testInfo = loadJson(root / f"info{testNum}.json")
+    testTaskIsFastInfo = tuple(testInfo["choices"])
+
+    matrix = getEvaluationMatrix(
+        optimized=optimized, statistic=statistic, memoryMetric=memoryMetric
+    )
+    withMemory = memoryMetric is not None
+    if models is None:
+        models = discoverModels(matrix, testNum)
+
+    modelTestResults = {
+        model: getModelTestResult(
+            testNum,
+            model=model,
+            optimized=optimized,
+            root=root,
+            statistic=statistic,
+            runtimes=sliceRuntimes(matrix, kind="task", testNum=testNum, model=model),
+            memory=(
+                sliceRuntimes(
+                    matrix, "memory", kind="task", testNum=testNum, model=model
+                )
+                if withMemory
+                else None
+            ),
+        )
+        for model in models
+    }
+
+    return buildTestResultTable(
+        testNum,
+        exampleTitles=exampleTitles,
+        testTaskIsFastInfo=testTaskIsFastInfo,
+        runtimesFast=sliceRuntimes(matrix, kind="example", variant="codeFast"),
+        runtimesSlow=sliceRuntimes(matrix, kind="example", variant="codeSlow"),
+        modelTestResults=modelTestResults,
+        memoryFast=(
+            sliceRuntimes(matrix, "memory", kind="example", variant="codeFast")
+            if withMemory
+            else None
+        ),
+        memoryMetric=memoryMetric,
+    )
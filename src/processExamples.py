@@ -1,11 +1,27 @@
+import argparse
+import hashlib
 import re
-from typing import Iterator
-from dataclasses import asdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator
+from dataclasses import dataclass, asdict, field
 import random
 import json
-from benchmark import Benchmarker
-from utils import DB, starmap, Example, BenchmarkResult, TestInfo, getExamplesSorted
+from benchmark import Benchmarker, Engine
+from scheduler import BenchmarkScheduler
+from utils import (
+    DB,
+    starmap,
+    Example,
+    BenchmarkResult,
+    PairedResult,
+    ResultWriter,
+    TestInfo,
+    getExamplesSorted,
+    pendingFilter,
+    parseSweepArgs,
+)
 import codeProcessing
+from benchmark import includeRegex
 
 #### Extraction
 exampleRegex = re.compile(
@@ -17,72 +33,365 @@ exampleRegex = re.compile(
 )
 
 
+exampleHeading = "## Example "
+
+
+def exampleSections(lines: Iterable[str]) -> Iterator[str]:
+    """
+    text from each example heading up to the next one,
+    so that exampleRegex never runs over more than one example
+    """
+    section: list[str] = []
+    for line in lines:
+        if line.startswith(exampleHeading):
+            if section:
+                yield "".join(section)
+            section = [line]
+        elif section:
+            section.append(line)
+    if section:
+        yield "".join(section)
+
+
+whitespaceRegex = re.compile(r"\s+")
+
+
+def codeHash(codeSlow: str, codeFast: str) -> str:
+    """
+    identical for examples that only differ in comments and whitespace
+    """
+    h = hashlib.sha256()
+    for code in (codeSlow, codeFast):
+        h.update(
+            whitespaceRegex.sub(" ", codeProcessing.stripComments(code))
+            .strip()
+            .encode()
+        )
+        h.update(b"\0")
+    return h.hexdigest()
+
+
 def extractExamples(path: str) -> Iterator[Example]:
+    """
+    stream the examples of a markdown file, keyed by their position in it
+    """
     with open(path, "r") as f:
-        fileContent = f.read()
-
-    return starmap(
-        lambda i, match: Example(
-            _key=str(i),
-            title=match.group("title"),
-            description=match.group("description"),
-            codeSlow=match.group("codeSlow"),
-            codeFast=match.group("codeFast"),
-        ),
-        enumerate(exampleRegex.finditer(fileContent), start=1),
-    )
+        matches = filter(None, map(exampleRegex.match, exampleSections(f)))
+        for i, match in enumerate(matches, start=1):
+            yield Example(
+                _key=str(i),
+                title=match.group("title"),
+                description=match.group("description"),
+                codeSlow=match.group("codeSlow"),
+                codeFast=match.group("codeFast"),
+                codeHash=codeHash(match.group("codeSlow"), match.group("codeFast")),
+            )
+
+
+def extractExamplesList(path: str) -> list[Example]:
+    return list(extractExamples(path))
+
+
+@dataclass
+class IngestReport:
+    new: list[str] = field(default_factory=list)
+    # code changed, results of the previous code are stale
+    changed: list[str] = field(default_factory=list)
+    # only title or description changed
+    updated: list[str] = field(default_factory=list)
+    unchanged: list[str] = field(default_factory=list)
+    # (path, title) of examples whose code was already ingested
+    duplicates: list[tuple[str, str]] = field(default_factory=list)
+    # stored beyond the end of the corpus, deleted
+    removed: list[str] = field(default_factory=list)
+
+    def rebenchmark(self) -> list[str]:
+        """
+        --only patterns of the example results to rerun
+        """
+        return [f"{DB.examples}/{key}.*" for key in self.new + self.changed]
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.new)} new, {len(self.changed)} changed, "
+            f"{len(self.updated)} updated, {len(self.unchanged)} unchanged, "
+            f"{len(self.duplicates)} duplicates, {len(self.removed)} removed"
+        )
 
 
-def insertExamples(examples: Iterator[Example]):
-    DB.getCollection(DB.examples).import_bulk(
-        documents=list((asdict(example) for example in examples)),
-        on_duplicate="replace",
+def streamExamples(
+    paths: list[str],
+    maxWorkers: int | None = None,
+    duplicates: list[tuple[str, str]] | None = None,
+) -> Iterator[Example]:
+    """
+    parse the files in parallel and yield their examples in file order,
+    numbered consecutively across all files,
+    examples with the code of an earlier one are skipped and recorded in
+    duplicates
+    """
+    seen: set[str] = set()
+    key = 0
+    with ProcessPoolExecutor(maxWorkers) as executor:
+        for path, examples in zip(paths, executor.map(extractExamplesList, paths)):
+            for example in examples:
+                if example.codeHash in seen:
+                    if duplicates is not None:
+                        duplicates.append((path, example.title))
+                    continue
+                seen.add(example.codeHash)
+                key += 1
+                example._key = str(key)
+                yield example
+
+
+def insertExamples(
+    examples: Iterable[Example],
+    report: IngestReport | None = None,
+    batchSize: int = 500,
+) -> IngestReport:
+    """
+    upsert only the examples that are new or differ from the stored ones,
+    examples is the whole corpus, stored examples missing from it are deleted
+    """
+    report = report if report is not None else IngestReport()
+    stored = {doc["_key"]: doc for doc in DB.store().find(DB.examples, key="_key")}
+    batch: list[dict] = []
+    for example in examples:
+        doc = asdict(example)
+        previous = stored.get(example._key)
+        if previous is None:
+            report.new.append(example._key)
+        elif previous == doc:
+            report.unchanged.append(example._key)
+            continue
+        elif codeHash(previous["codeSlow"], previous["codeFast"]) != example.codeHash:
+            report.changed.append(example._key)
+        else:
+            report.updated.append(example._key)
+        batch.append(doc)
+        if len(batch) >= batchSize:
+            DB.store().upsert(DB.examples, batch, key="_key")
+            batch = []
+    if batch:
+        DB.store().upsert(DB.examples, batch, key="_key")
+
+    seen = set(report.new + report.changed + report.updated + report.unchanged)
+    report.removed = sorted(set(stored) - seen, key=int)
+    if report.removed:
+        DB.store().delete(DB.examples, report.removed, key="_key")
+    return report
+
+
+def ingestExamples(paths: list[str], maxWorkers: int | None = None) -> IngestReport:
+    report = IngestReport()
+    insertExamples(
+        streamExamples(paths, maxWorkers, duplicates=report.duplicates), report
     )
+    print(f"Ingested examples: {report.summary()}")
+    if rebenchmark := report.rebenchmark():
+        print("To re-benchmark: --only " + " ".join(rebenchmark))
+    if report.removed:
+        print(
+            "Results of removed examples are stale: "
+            + " ".join(f"{DB.examples}/{key}.*" for key in report.removed)
+        )
+    return report
+
+
+#### Precompiled header
+precompiledHeaderTemplate = """\
+// generated by processExamples.makePrecompiledHeader
+{includes}
+"""
+
+
+def makePrecompiledHeader(examples: Iterator[Example], path: str = "pch.h"):
+    """
+    write the union of the includes of the benchmark template and all examples,
+    the benchmark image precompiles this header (see Dockerfile)
+    """
+    includes = set()
+    for template in (
+        Benchmarker.codeTemplate,
+        Benchmarker.runBenchmarkAdaptiveTemplate,
+        Benchmarker.allocationsTemplate,
+        Benchmarker.pairTemplate,
+    ):
+        includes.update(re.findall(includeRegex, template))
+    for example in examples:
+        for code in (example.codeSlow, example.codeFast):
+            includes.update(codeProcessing.extract(code).includes)
+
+    with open(path, "w") as f:
+        f.write(precompiledHeaderTemplate.format(includes="\n".join(sorted(includes))))
 
 
 #### Benchmarking
-def runBenchmark(
-    benchmarker: Benchmarker,
-    filename: str,
-    code: str,
+def submitBenchmarks(
+    scheduler: BenchmarkScheduler,
+    codes: list[Benchmarker.Code],
     optimized: bool,
-) -> BenchmarkResult:
-    codeExtracted = codeProcessing.extract(code)
-    benchmarkCode = benchmarker.renderTemplate(codeExtracted)
-    output = benchmarker.run(benchmarkCode, stdout=False, optimized=optimized)
-
-    return BenchmarkResult.create(
-        filename=filename,
-        code=code,
-        benchmarkCode=benchmarkCode,
-        output=output,
-    )
+    batchSize: int,
+) -> Iterator[Benchmarker.Output]:
+    """
+    yield outputs in order of codes, batchSize > 1 benchmarks that many
+    codes per program
+    """
+    if batchSize <= 1:
+        futures = [
+            scheduler.submit(
+                scheduler.benchmarker.renderTemplate(code),
+                optimized=optimized,
+                stdout=False,
+            )
+            for code in codes
+        ]
+        return (future.result() for future in futures)
 
+    batches = [
+        scheduler.submitBatch(codes[i : i + batchSize], optimized=optimized)
+        for i in range(0, len(codes), batchSize)
+    ]
+    return (output for batch in batches for output in batch.result())
 
-def benchmarkExamples(optimized: bool):
-    benchmarker = Benchmarker()
-    benchmarkCollection = DB.getCollection(
-        DB.benchmarksOptimized if optimized else DB.benchmarksUnoptimized
-    )
 
-    for example in getExamplesSorted():
-        print("\r", end="")
-        print(f"Benchmarking example {example._key}", end="")
-        benchResultSlow = runBenchmark(
-            benchmarker,
-            filename=f"{DB.examples}/{example._key}.codeSlow",
-            code=example.codeSlow,
+def benchmarkExamples(
+    optimized: bool,
+    maxConcurrency: int = 1,
+    execCpus: list[int] | None = None,
+    nanobenchOptions: Benchmarker.NanobenchOptions = Benchmarker.NanobenchOptions(),
+    batchSize: int = 1,
+    engine: Engine = "nanobench",
+    force: bool = False,
+    only: list[str] | None = None,
+    limits: Benchmarker.Limits = Benchmarker.Limits(),
+):
+    """
+    benchmark the examples that have no completed result for their current
+    code and configuration yet, force reruns them regardless,
+    only restricts the sweep to filenames matching one of the glob patterns,
+    a job exceeding limits is stored with status "timeout" or "oom"
+    """
+    collection = DB.benchmarks(optimized, engine)
+    with (
+        ResultWriter(collection) as resultWriter,
+        Benchmarker(
+            nanobenchOptions=nanobenchOptions,
+            poolSize=maxConcurrency,
+            engine=engine,
+            limits=limits,
+        ) as benchmarker,
+        BenchmarkScheduler(benchmarker, maxConcurrency, execCpus) as scheduler,
+    ):
+        pending = pendingFilter(
+            collection,
+            force=force,
+            only=only,
+            limitsHash=benchmarker.limitsHash(),
+        )
+        jobs = []
+        for example in getExamplesSorted():
+            for filename, code in (
+                (f"{DB.examples}/{example._key}.codeSlow", example.codeSlow),
+                (f"{DB.examples}/{example._key}.codeFast", example.codeFast),
+            ):
+                codeExtracted = codeProcessing.extract(code)
+                benchmarkCode = benchmarker.renderTemplate(codeExtracted)
+                configHash = benchmarker.configHash(benchmarkCode, optimized)
+                if pending(filename, configHash):
+                    jobs.append((filename, code, codeExtracted, configHash))
+        print(f"{len(jobs)} examples to benchmark")
+
+        outputs = submitBenchmarks(
+            scheduler,
+            [codeExtracted for _, _, codeExtracted, _ in jobs],
             optimized=optimized,
+            # callgrind counts one snippet per program and the peak rss of
+            # the allocation pass is the one of the whole process
+            batchSize=(
+                batchSize
+                if engine == "nanobench" and not nanobenchOptions.allocations
+                else 1
+            ),
         )
-        benchResultSlow.insertInto(benchmarkCollection)
 
-        benchResultFast = runBenchmark(
-            benchmarker,
-            filename=f"{DB.examples}/{example._key}.codeFast",
-            code=example.codeFast,
-            optimized=optimized,
+        for (filename, code, codeExtracted, configHash), output in zip(jobs, outputs):
+            resultWriter.write(
+                BenchmarkResult.create(
+                    filename=filename,
+                    code=code,
+                    benchmarkCode=benchmarker.renderTemplate(codeExtracted),
+                    output=output,
+                    configHash=configHash,
+                    optimized=optimized,
+                    limitsHash=benchmarker.limitsHash(),
+                )
+            )
+            print("\r", end="")
+            print(f"Benchmarking examples: {scheduler.report()}", end="")
+
+    print("\nDone")
+
+
+def compareExamples(
+    optimized: bool,
+    maxConcurrency: int = 1,
+    execCpus: list[int] | None = None,
+    pairOptions: Benchmarker.PairOptions = Benchmarker.PairOptions(),
+    confidence: float = 0.95,
+    force: bool = False,
+    only: list[str] | None = None,
+    limits: Benchmarker.Limits = Benchmarker.Limits(),
+):
+    """
+    measure every codeSlow interleaved with the codeFast of its example,
+    see benchmarkExamples for force, only and limits
+    """
+    collection = DB.pairs(optimized)
+    with (
+        ResultWriter(collection) as resultWriter,
+        Benchmarker(poolSize=maxConcurrency, limits=limits) as benchmarker,
+        BenchmarkScheduler(benchmarker, maxConcurrency, execCpus) as scheduler,
+    ):
+        pending = pendingFilter(
+            collection,
+            force=force,
+            only=only,
+            limitsHash=benchmarker.limitsHash(),
         )
-        benchResultFast.insertInto(benchmarkCollection)
+        jobs = []
+        for example in getExamplesSorted():
+            filename = f"{DB.examples}/{example._key}.codeSlow"
+            benchmarkCode = benchmarker.renderPairTemplate(
+                codeProcessing.extract(example.codeFast),
+                codeProcessing.extract(example.codeSlow),
+                pairOptions,
+            )
+            configHash = benchmarker.configHash(benchmarkCode, optimized)
+            if pending(filename, configHash):
+                output = scheduler.submit(
+                    benchmarkCode, optimized=optimized, stdout=False
+                )
+                jobs.append((filename, example, benchmarkCode, configHash, output))
+        print(f"{len(jobs)} examples to compare")
+
+        for filename, example, benchmarkCode, configHash, output in jobs:
+            resultWriter.write(
+                PairedResult.create(
+                    filename=filename,
+                    baseline=f"{DB.examples}/{example._key}.codeFast",
+                    code=example.codeSlow,
+                    benchmarkCode=benchmarkCode,
+                    output=output.result(),
+                    configHash=configHash,
+                    optimized=optimized,
+                    limitsHash=benchmarker.limitsHash(),
+                    confidence=confidence,
+                )
+            )
+            print("\r", end="")
+            print(f"Comparing examples: {scheduler.report()}", end="")
 
     print("\nDone")
 
@@ -180,26 +489,43 @@ def makeTests():
 
 
 #### example output validation
-def validateOutputs():
-    benchmarker = Benchmarker()
-    for example in getExamplesSorted():
-        print(end="\r")
-        print(f"Validating example {example._key}", end="\r")
-        result = benchmarker.compareOutputs(example.codeSlow, example.codeFast)
-        if not result.match:
-            print(f"Outputs for example {example._key} do not match:")
-            print("#### codeSlow:")
-            print(result.outputA.stdout)
-            print(result.outputA.stderr)
-            print("#### codeFast:")
-            print(result.outputB.stdout)
-            print(result.outputB.stderr)
+def validateOutputs(poolSize: int = 1):
+    with Benchmarker(poolSize=poolSize) as benchmarker:
+        for example in getExamplesSorted():
+            print(end="\r")
+            print(f"Validating example {example._key}", end="\r")
+            result = benchmarker.compareOutputs(example.codeSlow, example.codeFast)
+            if not result.match:
+                print(f"Outputs for example {example._key} do not match:")
+                print("#### codeSlow:")
+                print(result.outputA.stdout)
+                print(result.outputA.stderr)
+                print("#### codeFast:")
+                print(result.outputB.stdout)
+                print(result.outputB.stderr)
     print("\nDone")
 
 
 if __name__ == "__main__":
-    print("Benchmarking Examples Optimized")
-    benchmarkExamples(optimized=True)
-    
-    print("Benchmarking Examples Unoptimized")
-    benchmarkExamples(optimized=False)
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--pairs",
+        type=int,
+        metavar="N",
+        help="measure codeSlow against codeFast in N interleaved pairs instead",
+    )
+    args = parseSweepArgs("Benchmark the examples, resuming previous sweeps", parser)
+
+    for optimized in (True, False):
+        label = "Optimized" if optimized else "Unoptimized"
+        if args.pairs is not None:
+            print(f"Comparing Examples {label}")
+            compareExamples(
+                optimized=optimized,
+                pairOptions=Benchmarker.PairOptions(pairs=args.pairs),
+                force=args.force,
+                only=args.only,
+            )
+        else:
+            print(f"Benchmarking Examples {label}")
+            benchmarkExamples(optimized=optimized, force=args.force, only=args.only)
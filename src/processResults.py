@@ -1,8 +1,19 @@
+import argparse
 import re
 from pathlib import PosixPath as Path
-from codeProcessing import extractBlock, includeRegex
-from benchmark import Benchmarker
-from utils import BenchmarkResult, DB
+from typing import Callable, Iterator
+from codeProcessing import BlockIndex, extract, includeRegex
+from benchmark import Benchmarker, Engine
+from scheduler import BenchmarkScheduler
+from utils import (
+    BenchmarkResult,
+    DB,
+    PairedResult,
+    ResultWriter,
+    getExamplesSorted,
+    pendingFilter,
+    parseSweepArgs,
+)
 
 #### Benchmark agent code and write results to db
 fullDiffRegex = re.compile(
@@ -43,79 +54,246 @@ int main() {{
 namespaceRegex = re.compile(r"using namespace.*?\n")
 
 
+def extractTasks(code: str) -> list[tuple[Benchmarker.Code, str]]:
+    """
+    snippet and standalone program of each of the 50 tasks in a test file
+    """
+    includes = [s.strip() for s in re.findall(includeRegex, code)]
+
+    blocks = BlockIndex(code)
+    tasks = []
+    for taskNum in range(1, 51):
+        namespaceBlock = blocks.namespace(taskNum)
+        taskBlock = blocks.task(taskNum)
+
+        body = code[taskBlock.bodyStart : taskBlock.bodyEnd]
+        body = re.sub(namespaceRegex, "", body)
+
+        snippet = Benchmarker.Code(
+            includes=includes,
+            additionalDefs=code[namespaceBlock.bodyStart : namespaceBlock.bodyEnd],
+            body=body,
+        )
+
+        taskCode = taskTemplate.format(
+            includes="\n".join(includes),
+            additionalDefs=code[namespaceBlock.start : namespaceBlock.end],
+            taskCode=code[taskBlock.start : taskBlock.end],
+        )
+        tasks.append((snippet, taskCode))
+    return tasks
+
+
 def benchmarkTasks(
-    benchmarker: Benchmarker,
+    scheduler: BenchmarkScheduler,
     code: str,
     filenameStem: str,
     optimized: bool,
-):
-    includes = [s.strip() for s in re.findall(includeRegex, code)]
+    pending: Callable[[str, str], bool] | None = None,
+) -> Iterator[BenchmarkResult]:
+    """
+    yield the results of the tasks in code for which pending(filename, configHash)
+    holds, all tasks if pending is None
+    """
+    jobs = []
+    for taskNum, (snippet, taskCode) in enumerate(extractTasks(code), start=1):
+        benchmarkCode = scheduler.benchmarker.renderTemplate(snippet)
+        filename = f"{filenameStem}.task{taskNum}"
+        configHash = scheduler.benchmarker.configHash(benchmarkCode, optimized)
+        if pending is not None and not pending(filename, configHash):
+            continue
 
-    for taskNum in range(1, 51):
+        output = scheduler.submit(benchmarkCode, optimized=optimized, stdout=False)
+        jobs.append((filename, taskCode, benchmarkCode, configHash, output))
+
+    for filename, taskCode, benchmarkCode, configHash, output in jobs:
+        result = BenchmarkResult.create(
+            filename=filename,
+            code=taskCode,
+            benchmarkCode=benchmarkCode,
+            output=output.result(),
+            configHash=configHash,
+            optimized=optimized,
+            limitsHash=scheduler.benchmarker.limitsHash(),
+        )
         print("\r", end="")
-        print(f"Benchmarking task {taskNum} of 50", end="")
+        print(f"Benchmarking tasks: {scheduler.report()}", end="")
+        yield result
 
-        namespaceBlock = extractBlock(code, blockPreamble=f"namespace task{taskNum} ")
-        taskBlock = extractBlock(code, blockPreamble=f"// Task {taskNum}\n")
+    print("\nDone")
 
-        body = code[taskBlock.bodyStart : taskBlock.bodyEnd]
-        body = re.sub(namespaceRegex, "", body)
 
-        benchmarkCode = benchmarker.renderTemplate(
-            Benchmarker.Code(
-                includes=includes,
-                additionalDefs=code[namespaceBlock.bodyStart : namespaceBlock.bodyEnd],
-                body=body,
-            )
+def benchmarkAgentEdits(
+    optimized: bool,
+    maxConcurrency: int = 1,
+    execCpus: list[int] | None = None,
+    nanobenchOptions: Benchmarker.NanobenchOptions = Benchmarker.NanobenchOptions(),
+    engine: Engine = "nanobench",
+    force: bool = False,
+    only: list[str] | None = None,
+    limits: Benchmarker.Limits = Benchmarker.Limits(),
+):
+    """
+    see processExamples.benchmarkExamples for force, only and limits
+    """
+    collection = DB.benchmarks(optimized, engine)
+    with (
+        ResultWriter(collection) as resultWriter,
+        Benchmarker(
+            nanobenchOptions=nanobenchOptions,
+            poolSize=maxConcurrency,
+            engine=engine,
+            limits=limits,
+        ) as benchmarker,
+        BenchmarkScheduler(benchmarker, maxConcurrency, execCpus) as scheduler,
+    ):
+        pending = pendingFilter(
+            collection,
+            force=force,
+            only=only,
+            limitsHash=benchmarker.limitsHash(),
         )
+        logsDir = Path("chat-logs")
+        for i in (1, 2):
+            test = f"test{i}"
+            for chatLog in filter(
+                lambda path: path.is_file(),
+                Path.iterdir(logsDir / test),
+            ):
+                modelName = chatLog.stem
+                filenameStem = f"{test}.{modelName}"
 
-        output = benchmarker.run(benchmarkCode, stdout=False, optimized=optimized)
+                print(f"Benchmarking {filenameStem}")
 
-        yield BenchmarkResult.create(
-            filename=f"{filenameStem}.task{taskNum}",
-            code=taskTemplate.format(
-                includes="\n".join(includes),
-                additionalDefs=code[namespaceBlock.start : namespaceBlock.end],
-                taskCode=code[taskBlock.start : taskBlock.end],
-            ),
+                code = restoreAgentEdits(chatLog)
+                for benchResult in benchmarkTasks(
+                    scheduler=scheduler,
+                    code=code,
+                    filenameStem=filenameStem,
+                    optimized=optimized,
+                    pending=pending,
+                ):
+                    resultWriter.write(benchResult)
+
+
+#### Paired comparison with the fast examples
+def compareTasks(
+    scheduler: BenchmarkScheduler,
+    code: str,
+    filenameStem: str,
+    baselines: list[Benchmarker.Code],
+    optimized: bool,
+    pairOptions: Benchmarker.PairOptions,
+    confidence: float = 0.95,
+    pending: Callable[[str, str], bool] | None = None,
+) -> Iterator[PairedResult]:
+    """
+    yield the comparisons of the tasks in code with baselines[taskNum - 1],
+    see benchmarkTasks for pending
+    """
+    jobs = []
+    for taskNum, (snippet, taskCode) in enumerate(extractTasks(code), start=1):
+        benchmarkCode = scheduler.benchmarker.renderPairTemplate(
+            baselines[taskNum - 1], snippet, pairOptions
+        )
+        filename = f"{filenameStem}.task{taskNum}"
+        configHash = scheduler.benchmarker.configHash(benchmarkCode, optimized)
+        if pending is not None and not pending(filename, configHash):
+            continue
+
+        output = scheduler.submit(benchmarkCode, optimized=optimized, stdout=False)
+        jobs.append((filename, taskNum, taskCode, benchmarkCode, configHash, output))
+
+    for filename, taskNum, taskCode, benchmarkCode, configHash, output in jobs:
+        result = PairedResult.create(
+            filename=filename,
+            baseline=f"{DB.examples}/{taskNum}.codeFast",
+            code=taskCode,
             benchmarkCode=benchmarkCode,
-            output=output,
+            output=output.result(),
+            configHash=configHash,
+            optimized=optimized,
+            limitsHash=scheduler.benchmarker.limitsHash(),
+            confidence=confidence,
         )
+        print("\r", end="")
+        print(f"Comparing tasks: {scheduler.report()}", end="")
+        yield result
 
     print("\nDone")
 
 
-def benchmarkAgentEdits(optimized: bool):
-    benchmarker = Benchmarker()
-    benchmarkColl = DB.getCollection(
-        DB.benchmarksOptimized if optimized else DB.benchmarksUnoptimized
-    )
-
-    logsDir = Path("chat-logs")
-    for i in (1, 2):
-        test = f"test{i}"
-        for chatLog in filter(
-            lambda path: path.is_file(),
-            Path.iterdir(logsDir / test),
-        ):
-            modelName = chatLog.stem
-            filenameStem = f"{test}.{modelName}"
-
-            print(f"Benchmarking {filenameStem}")
-
-            code = restoreAgentEdits(chatLog)
-            for benchResult in benchmarkTasks(
-                benchmarker=benchmarker,
-                code=code,
-                filenameStem=filenameStem,
-                optimized=optimized,
+def compareAgentEdits(
+    optimized: bool,
+    maxConcurrency: int = 1,
+    execCpus: list[int] | None = None,
+    pairOptions: Benchmarker.PairOptions = Benchmarker.PairOptions(),
+    confidence: float = 0.95,
+    force: bool = False,
+    only: list[str] | None = None,
+    limits: Benchmarker.Limits = Benchmarker.Limits(),
+):
+    """
+    measure every agent edited task interleaved with the fast example of the
+    same number, see processExamples.benchmarkExamples for force, only and limits
+    """
+    collection = DB.pairs(optimized)
+    baselines = [extract(example.codeFast) for example in getExamplesSorted()]
+    with (
+        ResultWriter(collection) as resultWriter,
+        Benchmarker(poolSize=maxConcurrency, limits=limits) as benchmarker,
+        BenchmarkScheduler(benchmarker, maxConcurrency, execCpus) as scheduler,
+    ):
+        pending = pendingFilter(
+            collection,
+            force=force,
+            only=only,
+            limitsHash=benchmarker.limitsHash(),
+        )
+        logsDir = Path("chat-logs")
+        for i in (1, 2):
+            test = f"test{i}"
+            for chatLog in filter(
+                lambda path: path.is_file(),
+                Path.iterdir(logsDir / test),
             ):
-                benchResult.insertInto(benchmarkColl)
+                filenameStem = f"{test}.{chatLog.stem}"
+
+                print(f"Comparing {filenameStem}")
+
+                for pairResult in compareTasks(
+                    scheduler=scheduler,
+                    code=restoreAgentEdits(chatLog),
+                    filenameStem=filenameStem,
+                    baselines=baselines,
+                    optimized=optimized,
+                    pairOptions=pairOptions,
+                    confidence=confidence,
+                    pending=pending,
+                ):
+                    resultWriter.write(pairResult)
 
 
 if __name__ == "__main__":
-    print("Benchmarking Agent Edits Optimized")
-    benchmarkAgentEdits(optimized=True)
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--pairs",
+        type=int,
+        metavar="N",
+        help="compare with the fast examples in N interleaved pairs instead",
+    )
+    args = parseSweepArgs("Benchmark the agent edits, resuming previous sweeps", parser)
 
-    print("Benchmarking Agent Edits Unoptimized")
-    benchmarkAgentEdits(optimized=False)
+    for optimized in (True, False):
+        label = "Optimized" if optimized else "Unoptimized"
+        if args.pairs is not None:
+            print(f"Comparing Agent Edits {label}")
+            compareAgentEdits(
+                optimized=optimized,
+                pairOptions=Benchmarker.PairOptions(pairs=args.pairs),
+                force=args.force,
+                only=args.only,
+            )
+        else:
+            print(f"Benchmarking Agent Edits {label}")
+            benchmarkAgentEdits(optimized=optimized, force=args.force, only=args.only)
@@ -0,0 +1,186 @@
+"""
+Opt-in profiling stage for benchmark results
+
+Reruns the programs of selected benchmark results under perf (falling back to
+callgrind where perf gets no samples) and stores folded call stacks and the
+hottest symbols per result in the profile collections (see DB.profiles).
+Without --only, the agent edited tasks slower than the fast example of the
+same number are selected, together with both examples for comparison
+(see evaluateResults.compareProfiles).
+
+# Usage:
+python profileResults.py [--threshold RATIO] [--profiler perf|callgrind]
+"""
+
+import argparse
+from fnmatch import fnmatch
+from typing import get_args
+from benchmark import Benchmarker, Profiler
+from codeProcessing import extract
+from utils import (
+    DB,
+    ProfileResult,
+    ResultWriter,
+    pendingFilter,
+    parseSweepArgs,
+)
+
+
+#### Selection
+def regressions(
+    optimized: bool,
+    threshold: float = 1.1,
+    statistic: str = "runtimeAvg",
+) -> list[str]:
+    """
+    filenames of the agent edited tasks whose runtime exceeds threshold times
+    the one of the fast example of the same number, followed by the filenames
+    of the slow and fast examples of those numbers
+    """
+    collection = DB.results(DB.benchmarks(optimized))
+    examples = DB.store().select(
+        collection,
+        dict(kind="example", variant=["codeSlow", "codeFast"]),
+        fields=["filename", "num", "variant", statistic],
+    )
+    baseline = {
+        doc["num"]: doc.get(statistic, -1.0)
+        for doc in examples
+        if doc["variant"] == "codeFast"
+    }
+    tasks = DB.store().select(
+        collection,
+        dict(kind="task"),
+        fields=["filename", "num", statistic],
+    )
+
+    slowTasks = sorted(
+        (
+            task
+            for task in tasks
+            if baseline.get(task["num"], -1.0) > 0
+            and task.get(statistic, -1.0) > threshold * baseline[task["num"]]
+        ),
+        key=lambda task: task["filename"],
+    )
+    nums = {task["num"] for task in slowTasks}
+    return [task["filename"] for task in slowTasks] + [
+        doc["filename"]
+        for doc in sorted(examples, key=lambda doc: doc["filename"])
+        if doc["num"] in nums
+    ]
+
+
+def matching(optimized: bool, only: list[str]) -> list[str]:
+    """
+    filenames of the benchmark results matching one of the glob patterns
+    """
+    return sorted(
+        doc["filename"]
+        for doc in DB.store().find(DB.benchmarks(optimized), fields=["filename"])
+        if any(fnmatch(doc["filename"], pattern) for pattern in only)
+    )
+
+
+#### Profiling
+def profileBuild(
+    benchmarker: Benchmarker,
+    doc: dict,
+    profiler: Profiler,
+    optimized: bool,
+) -> Benchmarker.Build:
+    """
+    perf samples the benchmark program itself (its binary is usually still
+    cached), callgrind a program running the snippet once
+    """
+    if profiler == "callgrind":
+        code = Benchmarker.renderCallgrindTemplate(extract(doc["code"]))
+    else:
+        code = doc["benchmarkCode"]
+    return benchmarker.compile(code, optimized=optimized)
+
+
+def profileBenchmarks(
+    optimized: bool,
+    filenames: list[str],
+    profiler: Profiler = "perf",
+    fallback: Profiler | None = "callgrind",
+    topN: int = 20,
+    force: bool = False,
+    limits: Benchmarker.Limits = Benchmarker.Limits(),
+):
+    """
+    profile the executed benchmark results with the given filenames that have
+    no profile for their current config hash yet, force reprofiles them;
+    fallback is used where profiler yields no samples (e.g. perf_event_open
+    is not permitted)
+    """
+    benchmarks = DB.benchmarks(optimized)
+    collection = DB.profiles(optimized)
+    with (
+        ResultWriter(collection) as resultWriter,
+        Benchmarker(
+            perfAccess="perf" in (profiler, fallback), limits=limits
+        ) as benchmarker,
+    ):
+        pending = pendingFilter(collection, force=force)
+        for i, filename in enumerate(filenames, start=1):
+            print("\r", end="")
+            print(f"Profiling benchmarks: {i}/{len(filenames)}", end="")
+            doc = DB.store().get(benchmarks, filename)
+            if (
+                doc is None
+                or not doc.get("executed")
+                or not pending(filename, doc["configHash"])
+            ):
+                continue
+
+            for candidate in (profiler, fallback):
+                if candidate is None:
+                    continue
+                build = profileBuild(benchmarker, doc, candidate, optimized)
+                result = ProfileResult.create(
+                    filename=filename,
+                    profiler=candidate,
+                    output=(
+                        benchmarker.profile(build, candidate)
+                        if build.compiled
+                        else build.output
+                    ),
+                    configHash=doc["configHash"],
+                    optimized=optimized,
+                    topN=topN,
+                )
+                if result.executed:
+                    break
+            resultWriter.write(result)
+
+    print("\nDone")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.1,
+        help="select tasks slower than RATIO times the fast example",
+        metavar="RATIO",
+    )
+    parser.add_argument("--profiler", choices=get_args(Profiler), default="perf")
+    args = parseSweepArgs("Profile slow agent edits or selected benchmarks", parser)
+
+    for optimized in (True, False):
+        print(f"Profiling {'Optimized' if optimized else 'Unoptimized'}")
+        filenames = (
+            matching(optimized, args.only)
+            if args.only
+            else regressions(optimized, args.threshold)
+        )
+        profileBenchmarks(
+            optimized,
+            filenames,
+            profiler=args.profiler,
+            fallback="callgrind" if args.profiler == "perf" else None,
+            force=args.force,
+        )
@@ -0,0 +1,230 @@
+from __future__ import annotations
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from benchmark import Benchmarker
+
+
+class BenchmarkScheduler:
+    """
+    Runs the compile stage of benchmark jobs concurrently and hands the timed
+    execution stage to a limited set of execution slots.
+
+    Without execCpus there is a single unpinned slot and no compile runs while
+    it executes, i.e. measurements see the same idle machine as in the
+    sequential sweep. With execCpus every slot is pinned to one of the given
+    cpus and compiles are kept off those cpus, so measurements neither overlap
+    on a core nor share it with the compiler.
+    """
+
+    @dataclass
+    class Stats:
+        submitted: int = 0
+        compiling: int = 0
+        waiting: int = 0
+        executing: int = 0
+        completed: int = 0
+        startTime: float = field(default_factory=time.perf_counter)
+
+        @property
+        def queueDepth(self) -> int:
+            return self.submitted - self.completed
+
+        @property
+        def queued(self) -> int:
+            return self.queueDepth - self.compiling - self.waiting - self.executing
+
+        @property
+        def throughput(self) -> float:
+            elapsed = time.perf_counter() - self.startTime
+            return self.completed / elapsed if elapsed > 0 else 0.0
+
+    def __init__(
+        self,
+        benchmarker: Benchmarker,
+        maxConcurrency: int | None = None,
+        execCpus: list[int] | None = None,
+    ):
+        self.benchmarker = benchmarker
+        self.maxConcurrency = maxConcurrency or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(max_workers=self.maxConcurrency)
+        self.stats = BenchmarkScheduler.Stats()
+        self.statsLock = threading.Lock()
+
+        self.execSlots: queue.Queue[str | None] = queue.Queue()
+        self.compileCpus = None
+        # unpinned executions exclude compiles, see compileStage / executeStage
+        self.exclusive = not execCpus
+        self.gate = threading.Condition()
+        self.compiles = 0
+        self.executionPending = False
+        if execCpus:
+            for cpu in execCpus:
+                self.execSlots.put(str(cpu))
+            compileCpus = sorted(set(range(os.cpu_count() or 1)) - set(execCpus))
+            if compileCpus:
+                self.compileCpus = ",".join(map(str, compileCpus))
+        else:
+            self.execSlots.put(None)
+
+    def count(self, **deltas: int):
+        with self.statsLock:
+            for name, delta in deltas.items():
+                setattr(self.stats, name, getattr(self.stats, name) + delta)
+
+    def compileStage(self, code: str, optimized: bool) -> Benchmarker.Build:
+        if self.exclusive:
+            # an execution waiting for its slot to quiesce goes first
+            with self.gate:
+                self.gate.wait_for(lambda: not self.executionPending)
+                self.compiles += 1
+        self.count(compiling=1)
+        try:
+            return self.benchmarker.compile(
+                code, optimized=optimized, cpus=self.compileCpus
+            )
+        finally:
+            self.count(compiling=-1)
+            if self.exclusive:
+                with self.gate:
+                    self.compiles -= 1
+                    self.gate.notify_all()
+
+    def executeStage(
+        self,
+        build: Benchmarker.Build,
+        stdout: bool,
+        stderr: bool,
+    ) -> Benchmarker.Output:
+        self.count(waiting=1)
+        cpus = self.execSlots.get()
+        if self.exclusive:
+            # the single slot makes this the only pending execution
+            with self.gate:
+                self.executionPending = True
+                self.gate.wait_for(lambda: self.compiles == 0)
+        self.count(waiting=-1, executing=1)
+        try:
+            return self.benchmarker.execute(
+                build, stdout=stdout, stderr=stderr, cpus=cpus
+            )
+        finally:
+            if self.exclusive:
+                with self.gate:
+                    self.executionPending = False
+                    self.gate.notify_all()
+            self.execSlots.put(cpus)
+            self.count(executing=-1)
+
+    def runStages(
+        self,
+        code: str,
+        optimized: bool,
+        stdout: bool,
+        stderr: bool,
+    ) -> Benchmarker.Output:
+        build = self.compileStage(code, optimized)
+        if not build.compiled:
+            return build.output
+        return self.executeStage(build, stdout, stderr)
+
+    def job(
+        self,
+        code: str,
+        optimized: bool,
+        stdout: bool,
+        stderr: bool,
+    ) -> Benchmarker.Output:
+        try:
+            return self.runStages(code, optimized, stdout, stderr)
+        finally:
+            self.count(completed=1)
+
+    def submit(
+        self,
+        code: str,
+        optimized: bool = True,
+        stdout: bool = True,
+        stderr: bool = True,
+    ) -> Future[Benchmarker.Output]:
+        self.count(submitted=1)
+        return self.executor.submit(self.job, code, optimized, stdout, stderr)
+
+    def runBatch(
+        self,
+        codes: list[Benchmarker.Code],
+        optimized: bool,
+    ) -> list[Benchmarker.Output]:
+        if len(codes) == 1:
+            return [
+                self.runStages(
+                    self.benchmarker.renderTemplate(codes[0]),
+                    optimized,
+                    stdout=False,
+                    stderr=True,
+                )
+            ]
+
+        output = self.runStages(
+            self.benchmarker.renderBatchTemplate(codes),
+            optimized,
+            stdout=False,
+            stderr=True,
+        )
+        outputs = Benchmarker.demultiplex(output, len(codes))
+        if outputs is not None:
+            return outputs
+
+        # bisect until the snippets breaking the batch are built on their own
+        half = len(codes) // 2
+        return self.runBatch(codes[:half], optimized) + self.runBatch(
+            codes[half:], optimized
+        )
+
+    def batchJob(
+        self,
+        codes: list[Benchmarker.Code],
+        optimized: bool,
+    ) -> list[Benchmarker.Output]:
+        try:
+            return self.runBatch(codes, optimized)
+        finally:
+            self.count(completed=1)
+
+    def submitBatch(
+        self,
+        codes: list[Benchmarker.Code],
+        optimized: bool = True,
+    ) -> Future[list[Benchmarker.Output]]:
+        """
+        benchmark codes in a single program, returns the outputs in order of codes
+        """
+        self.count(submitted=1)
+        return self.executor.submit(self.batchJob, codes, optimized)
+
+    def report(self) -> str:
+        stats = self.stats
+        return (
+            f"queued: {stats.queued}, "
+            f"compiling: {stats.compiling}, "
+            f"waiting: {stats.waiting}, "
+            f"executing: {stats.executing}, "
+            f"done: {stats.completed}/{stats.submitted} "
+            f"({stats.throughput:.2f} jobs/s)"
+        )
+
+    def close(self, cancel: bool = False):
+        """
+        wait for the running jobs, cancel drops the queued ones
+        """
+        self.executor.shutdown(wait=True, cancel_futures=cancel)
+
+    def __enter__(self) -> BenchmarkScheduler:
+        return self
+
+    def __exit__(self, excType, *_):
+        # e.g. on KeyboardInterrupt the remaining sweep would be discarded anyway
+        self.close(cancel=excType is not None)
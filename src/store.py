@@ -0,0 +1,380 @@
+from __future__ import annotations
+import json
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from arango import ArangoClient
+from arango.database import StandardDatabase
+from arango.http import DefaultHTTPClient
+
+
+class Store(ABC):
+    """
+    Storage backend of examples and benchmark results.
+    A collection holds JSON documents that are unique on one key attribute,
+    `filename` for benchmark results and `_key` for examples.
+    """
+
+    @abstractmethod
+    def ensureCollection(self, collection: str, key: str = "filename"):
+        pass
+
+    @abstractmethod
+    def upsert(self, collection: str, docs: list[dict], key: str = "filename"):
+        """
+        insert or replace docs by their key
+        """
+
+    @abstractmethod
+    def get(self, collection: str, value: str, key: str = "filename") -> dict | None:
+        pass
+
+    @abstractmethod
+    def delete(self, collection: str, values: list[str], key: str = "filename"):
+        """
+        remove the documents whose key is one of values
+        """
+
+    @abstractmethod
+    def find(
+        self,
+        collection: str,
+        keyLike: str | None = None,
+        fields: list[str] | None = None,
+        key: str = "filename",
+    ) -> list[dict]:
+        """
+        documents whose key matches the LIKE pattern keyLike (% and _ wildcards,
+        case sensitive), all documents if keyLike is None,
+        restricted to fields if given (left out where a document lacks them)
+        """
+
+    @abstractmethod
+    def ensureIndex(self, collection: str, fields: list[str]):
+        """
+        persistent index on fields, a no-op if it exists
+        """
+
+    @abstractmethod
+    def select(
+        self,
+        collection: str,
+        filters: dict,
+        fields: list[str] | None = None,
+    ) -> list[dict]:
+        """
+        documents whose attributes equal the values in filters,
+        a list value matches any of its elements
+        """
+
+    @abstractmethod
+    def revision(self, collection: str) -> str:
+        """
+        changes whenever a document of collection is written
+        """
+
+    def close(self):
+        pass
+
+
+class ArangoStore(Store):
+    """
+    ArangoDB server, one client per store shared by all threads,
+    its HTTP session keeps up to poolSize connections alive
+    """
+
+    def __init__(self, host: str = "http://localhost:8529", poolSize: int = 16):
+        self.client = ArangoClient(
+            hosts=host,
+            http_client=DefaultHTTPClient(
+                pool_connections=poolSize,
+                pool_maxsize=poolSize,
+            ),
+        )
+        self.database: StandardDatabase = self.client.db()
+
+    def ensureCollection(self, collection: str, key: str = "filename"):
+        if not self.database.has_collection(collection):
+            self.database.create_collection(collection)
+            if key != "_key":
+                self.database.collection(collection).add_persistent_index(
+                    fields=[key], unique=True
+                )
+
+    def upsert(self, collection: str, docs: list[dict], key: str = "filename"):
+        # an upsert does not see the documents inserted earlier in its loop,
+        # a repeated key would violate the unique index, the last one wins
+        docs = list({doc[key]: doc for doc in docs}.values())
+        query = (
+            "for doc in @docs "
+            f"upsert {{ {key}: doc.{key} }} "
+            "insert doc "
+            "replace doc "
+            "in @@collection"
+        )
+        self.database.aql.execute(
+            query, bind_vars={"docs": docs, "@collection": collection}
+        )
+
+    def get(self, collection: str, value: str, key: str = "filename") -> dict | None:
+        query = (
+            "for doc in @@collection "
+            f"filter doc.{key} == @value "
+            "limit 1 "
+            'return unset(doc, "_id", "_rev")'
+        )
+        return next(
+            self.database.aql.execute(
+                query, bind_vars={"@collection": collection, "value": value}
+            ),
+            None,
+        )
+
+    def delete(self, collection: str, values: list[str], key: str = "filename"):
+        query = (
+            "for doc in @@collection "
+            f"filter doc.{key} in @values "
+            "remove doc in @@collection"
+        )
+        self.database.aql.execute(
+            query, bind_vars={"values": values, "@collection": collection}
+        )
+
+    def find(
+        self,
+        collection: str,
+        keyLike: str | None = None,
+        fields: list[str] | None = None,
+        key: str = "filename",
+    ) -> list[dict]:
+        query = (
+            "for doc in @@collection",
+            f"  filter @keyLike == null or doc.{key} like @keyLike",
+            (
+                '  return unset(doc, "_id", "_rev")'
+                if fields is None
+                else "  return keep(doc, @fields)"
+            ),
+        )
+        bindVars = {"@collection": collection, "keyLike": keyLike}
+        if fields is not None:
+            bindVars["fields"] = fields
+        return list(self.database.aql.execute("\n".join(query), bind_vars=bindVars))
+
+    def ensureIndex(self, collection: str, fields: list[str]):
+        self.database.collection(collection).add_persistent_index(fields=fields)
+
+    def select(
+        self,
+        collection: str,
+        filters: dict,
+        fields: list[str] | None = None,
+    ) -> list[dict]:
+        query = [
+            "for doc in @@collection",
+            *(
+                f"  filter doc.{name} {'in' if isinstance(value, list) else '=='} @v{i}"
+                for i, (name, value) in enumerate(filters.items())
+            ),
+            (
+                '  return unset(doc, "_id", "_rev")'
+                if fields is None
+                else "  return keep(doc, @fields)"
+            ),
+        ]
+        bindVars = {"@collection": collection} | {
+            f"v{i}": value for i, value in enumerate(filters.values())
+        }
+        if fields is not None:
+            bindVars["fields"] = fields
+        return list(self.database.aql.execute("\n".join(query), bind_vars=bindVars))
+
+    def revision(self, collection: str) -> str:
+        return self.database.collection(collection).revision()
+
+    def close(self):
+        self.client.close()
+
+
+class SQLiteStore(Store):
+    """
+    Embedded store in a single SQLite file, no server needed.
+    Every collection is a table of (key, JSON document) with the key as
+    primary key. The database runs in WAL mode so that analysis can read
+    while a sweep writes, every upsert is one transaction.
+    Every write gives the collection a new random revision, kept in the
+    revisions table.
+    """
+
+    revisions = "_revisions"
+
+    def __init__(self, path: str = "benchmarks.sqlite"):
+        self.path = path
+        # shared by the sweep and the result writer's flush thread
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.tables: set[str] = set()
+        with self.lock:
+            self.connection.execute("pragma journal_mode = wal")
+            self.connection.execute("pragma synchronous = normal")
+            # like Arango's LIKE, also lets prefix patterns use the key index
+            self.connection.execute("pragma case_sensitive_like = on")
+            with self.connection:
+                self.connection.execute(
+                    f"create table if not exists {SQLiteStore.revisions} "
+                    "(collection text primary key, revision text not null)"
+                )
+
+    @staticmethod
+    def table(collection: str) -> str:
+        return '"' + collection.replace('"', '""') + '"'
+
+    @staticmethod
+    def attribute(name: str) -> str:
+        # indexes are only used by queries spelling out the same expression
+        return f"json_extract(doc, '$.\"{name}\"')"
+
+    @staticmethod
+    def projection(fields: list[str] | None) -> str:
+        if fields is None:
+            return "doc"
+        # extract the fields in SQL instead of decoding whole documents,
+        # one column per field, NULL where the document lacks it
+        return ", ".join(f"doc -> '$.\"{field}\"'" for field in fields)
+
+    @staticmethod
+    def decode(rows: list[tuple], fields: list[str] | None) -> list[dict]:
+        """
+        documents from rows of projection, missing fields are left out like
+        Arango's keep() does
+        """
+        if fields is None:
+            return [json.loads(doc) for (doc,) in rows]
+        return [
+            {
+                field: json.loads(value)
+                for field, value in zip(fields, row)
+                if value is not None
+            }
+            for row in rows
+        ]
+
+    def ensureCollection(self, collection: str, key: str = "filename"):
+        if collection in self.tables:
+            return
+        with self.lock, self.connection:
+            self.connection.execute(
+                f"create table if not exists {SQLiteStore.table(collection)} "
+                "(key text primary key, doc text not null)"
+            )
+            self.tables.add(collection)
+
+    def upsert(self, collection: str, docs: list[dict], key: str = "filename"):
+        self.ensureCollection(collection, key)
+        rows = [(doc[key], json.dumps(doc)) for doc in docs]
+        with self.lock, self.connection:
+            self.connection.executemany(
+                f"insert into {SQLiteStore.table(collection)} (key, doc) "
+                "values (?, ?) "
+                "on conflict (key) do update set doc = excluded.doc",
+                rows,
+            )
+            self.touch(collection)
+
+    def touch(self, collection: str):
+        """
+        give collection a new revision, within the transaction of the write
+        """
+        self.connection.execute(
+            f"insert into {SQLiteStore.revisions} (collection, revision) "
+            "values (?, ?) "
+            "on conflict (collection) do update set revision = excluded.revision",
+            (collection, uuid.uuid4().hex),
+        )
+
+    def delete(self, collection: str, values: list[str], key: str = "filename"):
+        self.ensureCollection(collection, key)
+        with self.lock, self.connection:
+            self.connection.executemany(
+                f"delete from {SQLiteStore.table(collection)} where key = ?",
+                [(value,) for value in values],
+            )
+            self.touch(collection)
+
+    def get(self, collection: str, value: str, key: str = "filename") -> dict | None:
+        self.ensureCollection(collection, key)
+        with self.lock:
+            row = self.connection.execute(
+                f"select doc from {SQLiteStore.table(collection)} where key = ?",
+                (value,),
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def find(
+        self,
+        collection: str,
+        keyLike: str | None = None,
+        fields: list[str] | None = None,
+        key: str = "filename",
+    ) -> list[dict]:
+        self.ensureCollection(collection, key)
+        query = (
+            f"select {SQLiteStore.projection(fields)} "
+            f"from {SQLiteStore.table(collection)}"
+        )
+        params = ()
+        if keyLike is not None:
+            query += " where key like ?"
+            params = (keyLike,)
+        with self.lock:
+            rows = self.connection.execute(query, params).fetchall()
+        return SQLiteStore.decode(rows, fields)
+
+    def ensureIndex(self, collection: str, fields: list[str]):
+        self.ensureCollection(collection)
+        name = SQLiteStore.table(f"{collection}.{'.'.join(fields)}")
+        with self.lock, self.connection:
+            self.connection.execute(
+                f"create index if not exists {name} "
+                f"on {SQLiteStore.table(collection)} "
+                f"({', '.join(map(SQLiteStore.attribute, fields))})"
+            )
+
+    def select(
+        self,
+        collection: str,
+        filters: dict,
+        fields: list[str] | None = None,
+    ) -> list[dict]:
+        self.ensureCollection(collection)
+        conditions = []
+        params = []
+        for name, value in filters.items():
+            values = value if isinstance(value, list) else [value]
+            conditions.append(
+                f"{SQLiteStore.attribute(name)} in ({', '.join('?' * len(values))})"
+            )
+            # JSON true / false are extracted as 1 / 0
+            params.extend(int(v) if isinstance(v, bool) else v for v in values)
+        query = (
+            f"select {SQLiteStore.projection(fields)} "
+            f"from {SQLiteStore.table(collection)}"
+        )
+        if conditions:
+            query += " where " + " and ".join(conditions)
+        with self.lock:
+            rows = self.connection.execute(query, params).fetchall()
+        return SQLiteStore.decode(rows, fields)
+
+    def revision(self, collection: str) -> str:
+        with self.lock:
+            row = self.connection.execute(
+                f"select revision from {SQLiteStore.revisions} where collection = ?",
+                (collection,),
+            ).fetchone()
+        return row[0] if row is not None else ""
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,317 @@
+"""
+Budget-aware triage of the agent edited tasks
+
+Measures every task interleaved with a reference example of the same number
+(see Benchmarker.renderPairTemplate) in rounds of successive halving: the
+first round gives every task a few pairs, every further round doubles the
+pairs and spends them only on the tasks whose ratio to the reference is still
+ambiguous, at most half of the tasks of the previous round. Rounds stop when
+no task is ambiguous or the time budget is used up: a round that would exceed
+the budget left only measures the tasks it still affords, the first round
+with an estimated overhead per job. The budget is shared by both optimization
+levels, the unoptimized one gets what the optimized one left. Every run
+measures from scratch, the merged comparisons and their verdicts replace the
+ones in the triage collections (see DB.triage).
+
+# Usage:
+python triageResults.py [--budget SECONDS] [--pairs N] [--margin RATIO]
+                        [--reference codeFast|codeSlow]
+"""
+
+import argparse
+import math
+import time
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from pathlib import PosixPath as Path
+from typing import Literal, get_args
+from codeProcessing import extract
+from benchmark import Benchmarker
+from scheduler import BenchmarkScheduler
+from processResults import extractTasks, restoreAgentEdits
+from utils import (
+    DB,
+    PairedResult,
+    ResultWriter,
+    getExamplesSorted,
+    parseSweepArgs,
+)
+
+Verdict = Literal["faster", "slower", "equivalent", "ambiguous"]
+Reference = Literal["codeFast", "codeSlow"]
+
+
+@dataclass
+class Candidate:
+    filename: str
+    code: str
+    snippet: Benchmarker.Code
+    baseline: str
+    baselineSnippet: Benchmarker.Code
+
+
+#### Candidates
+def getCandidates(
+    reference: Reference = "codeFast",
+    only: list[str] | None = None,
+) -> list[Candidate]:
+    """
+    the agent edited tasks of all chat logs with the reference example of the
+    same number, only restricts them to filenames matching a glob pattern
+    """
+    references = [
+        extract(getattr(example, reference)) for example in getExamplesSorted()
+    ]
+    candidates = []
+    logsDir = Path("chat-logs")
+    for i in (1, 2):
+        test = f"test{i}"
+        for chatLog in sorted(
+            filter(lambda path: path.is_file(), Path.iterdir(logsDir / test))
+        ):
+            code = restoreAgentEdits(chatLog)
+            for taskNum, (snippet, taskCode) in enumerate(extractTasks(code), 1):
+                filename = f"{test}.{chatLog.stem}.task{taskNum}"
+                if only and not any(fnmatch(filename, pattern) for pattern in only):
+                    continue
+                candidates.append(
+                    Candidate(
+                        filename=filename,
+                        code=taskCode,
+                        snippet=snippet,
+                        baseline=f"{DB.examples}/{taskNum}.{reference}",
+                        baselineSnippet=references[taskNum - 1],
+                    )
+                )
+    return candidates
+
+
+#### Triage
+def verdict(result: PairedResult, margin: float = 1.05) -> Verdict:
+    """
+    equivalent if the confidence interval of the ratio lies within
+    [1 / margin, margin], faster or slower if it excludes 1, ambiguous otherwise
+    """
+    low, high = result.log10RatioLow, result.log10RatioHigh
+    if low is None or high is None:
+        return "ambiguous"
+    band = math.log10(margin)
+    if -band < low and high < band:
+        return "equivalent"
+    if high < 0:
+        return "faster"
+    if low > 0:
+        return "slower"
+    return "ambiguous"
+
+
+def intervalWidth(result: PairedResult) -> float:
+    if result.log10RatioLow is None or result.log10RatioHigh is None:
+        return math.inf
+    return result.log10RatioHigh - result.log10RatioLow
+
+
+def runRound(
+    scheduler: BenchmarkScheduler,
+    candidates: list[Candidate],
+    results: dict[str, PairedResult],
+    optimized: bool,
+    pairOptions: Benchmarker.PairOptions,
+    confidence: float,
+):
+    """
+    measure the candidates with pairOptions.pairs further pairs each and
+    merge the pairs into results
+    """
+    jobs = []
+    for candidate in candidates:
+        benchmarkCode = scheduler.benchmarker.renderPairTemplate(
+            candidate.baselineSnippet, candidate.snippet, pairOptions
+        )
+        output = scheduler.submit(benchmarkCode, optimized=optimized, stdout=False)
+        jobs.append((candidate, benchmarkCode, output))
+
+    for candidate, benchmarkCode, output in jobs:
+        output = output.result()
+        result = PairedResult.create(
+            filename=candidate.filename,
+            baseline=candidate.baseline,
+            code=candidate.code,
+            benchmarkCode=benchmarkCode,
+            output=output,
+            configHash=scheduler.benchmarker.configHash(benchmarkCode, optimized),
+            optimized=optimized,
+            limitsHash=scheduler.benchmarker.limitsHash(),
+            confidence=confidence,
+        )
+        previous = results.get(candidate.filename)
+        if previous is not None and previous.executed:
+            # a failed round keeps the pairs measured so far
+            if result.executed:
+                previous.addSamples(*Benchmarker.parsePair(output.stderr))
+            result = previous
+        results[candidate.filename] = result
+        print("\r", end="")
+        print(f"Triaging tasks: {scheduler.report()}", end="")
+    print()
+
+
+def triage(
+    optimized: bool,
+    candidates: list[Candidate],
+    budget: float = 3600.0,
+    initialPairs: int = 4,
+    margin: float = 1.05,
+    confidence: float = 0.95,
+    pairOptions: Benchmarker.PairOptions = Benchmarker.PairOptions(),
+    maxConcurrency: int = 1,
+    execCpus: list[int] | None = None,
+    limits: Benchmarker.Limits = Benchmarker.Limits(),
+    overheadEstimate: float = 5.0,
+) -> dict[str, PairedResult]:
+    """
+    triage the candidates within budget seconds (see module docstring),
+    pairOptions.pairs is replaced by the pairs of the round, initialPairs
+    must be at least 2 for a first confidence interval, overheadEstimate is
+    the compilation and container time per job assumed until it is measured
+    """
+    start = time.monotonic()
+    results: dict[str, PairedResult] = {}
+    active = candidates
+    pairs = initialPairs
+    # a pair runs one epoch of either snippet, the compilation, calibration
+    # and container overhead per job is measured in every round
+    secondsPerPair = 2 * pairOptions.epochTimeMs / 1000
+    overhead = overheadEstimate + pairOptions.calibrationEpochs * secondsPerPair
+    roundNum = 0
+    with (
+        Benchmarker(poolSize=maxConcurrency, limits=limits) as benchmarker,
+        BenchmarkScheduler(benchmarker, maxConcurrency, execCpus) as scheduler,
+    ):
+        while active:
+            remaining = budget - (time.monotonic() - start)
+            secondsPerJob = overhead + pairs * secondsPerPair
+            affordable = max(int(remaining * maxConcurrency / secondsPerJob), 0)
+            if affordable < len(active):
+                print(f"Budget left for {affordable} of {len(active)} tasks")
+                active = active[:affordable]
+            if not active:
+                break
+
+            print(f"Round {roundNum}: {len(active)} tasks, {pairs} pairs each")
+            roundStart = time.monotonic()
+            runRound(
+                scheduler,
+                active,
+                results,
+                optimized,
+                Benchmarker.PairOptions(
+                    pairs=pairs,
+                    epochTimeMs=pairOptions.epochTimeMs,
+                    calibrationEpochs=pairOptions.calibrationEpochs,
+                ),
+                confidence,
+            )
+            secondsPerJob = (
+                (time.monotonic() - roundStart) * min(maxConcurrency, len(active))
+            ) / len(active)
+            overhead = max(secondsPerJob - pairs * secondsPerPair, 0.0)
+
+            for candidate in active:
+                result = results[candidate.filename]
+                result.verdict = verdict(result, margin) if result.executed else ""
+            # narrow intervals are the closest to a decision
+            ambiguous = sorted(
+                (
+                    candidate
+                    for candidate in active
+                    if results[candidate.filename].verdict == "ambiguous"
+                ),
+                key=lambda candidate: intervalWidth(results[candidate.filename]),
+            )
+            active = ambiguous[: math.ceil(len(active) / 2)]
+            pairs *= 2
+            roundNum += 1
+
+    print(f"Triage took {time.monotonic() - start:.0f} s")
+    return results
+
+
+def report(results: dict[str, PairedResult]) -> str:
+    """
+    one line per task with the ratio, its confidence interval and verdict,
+    followed by the number of tasks per verdict
+    """
+    lines = []
+    counts: dict[str, int] = {}
+    for filename, result in results.items():
+        verdictName = result.verdict or result.status or "failed"
+        counts[verdictName] = counts.get(verdictName, 0) + 1
+        if result.log10RatioLow is None or result.log10RatioHigh is None:
+            interval = "-"
+        else:
+            interval = (
+                f"[{10**result.log10RatioLow:.3f}, {10**result.log10RatioHigh:.3f}]"
+            )
+        sign = (
+            "-" if result.signConfidence is None else f"{result.signConfidence:.3f}"
+        )
+        ratio = f"{result.ratio:.3f}" if result.ratio > 0 else "-"
+        lines.append(
+            f"{filename:>40} {result.pairs:>5} pairs "
+            f"ratio {ratio:>7} {interval:>18} sign {sign:>5} {verdictName}"
+        )
+    lines.append(", ".join(f"{count} {name}" for name, count in counts.items()))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=3600.0,
+        help="total time budget of both optimization levels",
+        metavar="SECONDS",
+    )
+    parser.add_argument(
+        "--pairs",
+        type=int,
+        default=4,
+        help="pairs per task in the first round",
+        metavar="N",
+    )
+    parser.add_argument(
+        "--margin",
+        type=float,
+        default=1.05,
+        help="ratios within [1 / RATIO, RATIO] count as equivalent",
+        metavar="RATIO",
+    )
+    parser.add_argument(
+        "--reference", choices=get_args(Reference), default="codeFast"
+    )
+    args = parseSweepArgs(
+        "Triage the agent edits within a time budget", parser, resumable=False
+    )
+    if args.pairs < 2:
+        parser.error("--pairs must be at least 2")
+
+    candidates = getCandidates(args.reference, args.only)
+    start = time.monotonic()
+    levels = (True, False)
+    for i, optimized in enumerate(levels):
+        print(f"Triaging {'Optimized' if optimized else 'Unoptimized'}")
+        # an even share of what is left
+        remaining = args.budget - (time.monotonic() - start)
+        results = triage(
+            optimized,
+            candidates,
+            budget=remaining / (len(levels) - i),
+            initialPairs=args.pairs,
+            margin=args.margin,
+        )
+        with ResultWriter(DB.triage(optimized)) as resultWriter:
+            for result in results.values():
+                resultWriter.write(result)
+        print(report(results))
@@ -1,10 +1,20 @@
 from __future__ import annotations
+import argparse
+import atexit
+import base64
 import json
+import math
+import os
+import re
+import statistics
+import struct
+import threading
 from dataclasses import dataclass, asdict, field
-from typing import Iterator
-from arango.collection import StandardCollection
-from arango import ArangoClient, DocumentInsertError
-from benchmark import Benchmarker
+from fnmatch import fnmatch
+from pathlib import PosixPath as Path
+from typing import Callable, Iterator, Literal
+from benchmark import Benchmarker, Engine, Profiler, Status
+from store import ArangoStore, SQLiteStore, Store
 
 
 starmap = lambda func, iterable: map(lambda val: func(*val), iterable)
@@ -14,14 +24,127 @@ class DB:
     examples = "code-optimization-examples"
     benchmarksOptimized = "benchmarks-optimized"
     benchmarksUnoptimized = "benchmarks-unoptimized"
+    profilesOptimized = "profiles-optimized"
+    profilesUnoptimized = "profiles-unoptimized"
+    pairsOptimized = "pairs-optimized"
+    pairsUnoptimized = "pairs-unoptimized"
+    triageOptimized = "triage-optimized"
+    triageUnoptimized = "triage-unoptimized"
+
+    # one store per process, created on first use and shared by all threads
+    backend: Literal["arango", "sqlite"] = "arango"
+    host = "http://localhost:8529"
+    poolSize = 16
+    path = "benchmarks.sqlite"
+    instance: Store | None = None
+    lock = threading.Lock()
+
+    # indexes of the result collections, matching the evaluation queries
+    resultIndexes = (
+        ["kind", "variant", "num"],
+        ["kind", "testNum", "model", "num"],
+    )
+    prepared: set[str] = set()
+
+    @staticmethod
+    def configure(
+        backend: Literal["arango", "sqlite"] | None = None,
+        host: str | None = None,
+        poolSize: int | None = None,
+        path: str | None = None,
+    ):
+        """
+        backend "arango" talks to the server at host,
+        "sqlite" keeps everything in the local file at path
+        """
+        with DB.lock:
+            DB.closeUnlocked()
+            if backend is not None:
+                DB.backend = backend
+            if host is not None:
+                DB.host = host
+            if poolSize is not None:
+                DB.poolSize = poolSize
+            if path is not None:
+                DB.path = path
+
+    @staticmethod
+    def store() -> Store:
+        instance = DB.instance
+        if instance is not None:
+            return instance
+        with DB.lock:
+            if DB.instance is None:
+                match DB.backend:
+                    case "arango":
+                        DB.instance = ArangoStore(DB.host, poolSize=DB.poolSize)
+                    case "sqlite":
+                        DB.instance = SQLiteStore(DB.path)
+                    case _:
+                        raise ValueError(f"Unknown store backend {DB.backend}")
+            return DB.instance
+
+    @staticmethod
+    def closeUnlocked():
+        if DB.instance is not None:
+            DB.instance.close()
+        DB.instance = None
+        DB.prepared = set()
 
     @staticmethod
-    def get():
-        return ArangoClient("http://localhost:8529").db()
+    def close():
+        with DB.lock:
+            DB.closeUnlocked()
 
     @staticmethod
-    def getCollection(coll):
-        return DB.get().collection(coll)
+    def benchmarks(optimized: bool, engine: Engine = "nanobench") -> str:
+        """
+        name of the collection holding benchmark results,
+        results of engines other than nanobench are kept in their own collection
+        """
+        name = DB.benchmarksOptimized if optimized else DB.benchmarksUnoptimized
+        return name if engine == "nanobench" else f"{name}-{engine}"
+
+    @staticmethod
+    def profiles(optimized: bool) -> str:
+        """
+        name of the collection holding profiles of benchmark results
+        """
+        return DB.profilesOptimized if optimized else DB.profilesUnoptimized
+
+    @staticmethod
+    def pairs(optimized: bool) -> str:
+        """
+        name of the collection holding paired comparisons, keyed by the
+        filename of the candidate
+        """
+        return DB.pairsOptimized if optimized else DB.pairsUnoptimized
+
+    @staticmethod
+    def triage(optimized: bool) -> str:
+        """
+        name of the collection holding the paired comparisons of the last
+        triage (see triageResults.py)
+        """
+        return DB.triageOptimized if optimized else DB.triageUnoptimized
+
+    @staticmethod
+    def results(collection: str) -> str:
+        """
+        create the result collection and its indexes once per process,
+        results stored before the structured fields existed get them
+        """
+        if collection not in DB.prepared:
+            store = DB.store()
+            store.ensureCollection(collection)
+            for fields in DB.resultIndexes:
+                store.ensureIndex(collection, fields)
+            backfillStructuredFields(collection)
+            DB.prepared.add(collection)
+        return collection
+
+
+atexit.register(DB.close)
 
 
 @dataclass
@@ -31,41 +154,105 @@ class Example:
     description: str
     codeSlow: str
     codeFast: str
+    # hash of the normalized code, see processExamples.codeHash
+    codeHash: str = ""
 
 
 def getExamplesSorted() -> Iterator[Example]:
-    query = (
-        f"for example in `{DB.examples}` "
-        "sort to_number(example._key) asc "
-        'return unset(example, "_id", "_rev")'
-    )
-
+    docs = DB.store().find(DB.examples, key="_key")
     return map(
         lambda doc: Example(**doc),
-        DB.get().aql.execute(query),
+        sorted(docs, key=lambda doc: int(doc["_key"])),
     )
 
 
+def packSamples(values: list[float]) -> str:
+    """
+    little endian float64 array, base64 encoded to fit into a JSON document
+    """
+    return base64.b64encode(struct.pack(f"<{len(values)}d", *values)).decode()
+
+
+def unpackSamples(packed: str) -> list[float]:
+    data = base64.b64decode(packed)
+    return list(struct.unpack(f"<{len(data) // 8}d", data))
+
+
+exampleFilenameRegex = re.compile(
+    rf"{re.escape(DB.examples)}/(?P<num>\d+)\.(?P<variant>code\w+)"
+)
+taskFilenameRegex = re.compile(r"test(?P<testNum>\d+)\.(?P<model>.+)\.task(?P<num>\d+)")
+
+
+def structuredFields(filename: str) -> dict:
+    """
+    kind, number, test number, model and variant encoded in a result filename
+    """
+    if match := exampleFilenameRegex.fullmatch(filename):
+        return dict(
+            kind="example",
+            num=int(match["num"]),
+            variant=match["variant"],
+        )
+    if match := taskFilenameRegex.fullmatch(filename):
+        return dict(
+            kind="task",
+            num=int(match["num"]),
+            testNum=int(match["testNum"]),
+            model=match["model"],
+            variant="agent",
+        )
+    return dict()
+
+
 @dataclass
 class BenchmarkResult:
     code: str
     benchmarkCode: str
     output: str
     filename: str = ""
+    # structured form of filename, see structuredFields
+    kind: Literal["example", "task", ""] = ""
+    num: int = -1
+    testNum: int = -1
+    model: str = ""
+    variant: Literal["codeSlow", "codeFast", "agent", ""] = ""
+    optimized: bool | None = None
+    # see Benchmarker.configHash
+    configHash: str = ""
     compiled: bool = False
     executed: bool = False
+    # why the job failed, "" for results stored before it existed
+    status: Status | Literal[""] = ""
+    # see Benchmarker.limitsHash
+    limitsHash: str = ""
     runtimeAvg: float = -1.0
+    # median absolute percent error of the epochs and the settings nanobench ran with
+    runtimeError: float = -1.0
+    nanobenchConfig: dict = field(default_factory=dict)
+    runtimeMedian: float = -1.0
+    runtimeMin: float = -1.0
+    runtimeIqr: float = -1.0
+    # per epoch elapsed time per iteration and iteration counts, see packSamples
+    samplesElapsed: str = ""
+    samplesIterations: str = ""
+    # from hardware counters, -1 if unavailable
+    ipc: float = -1.0
+    instructionsPerOp: float = -1.0
+    branchMissRate: float = -1.0
+    # from a callgrind run, -1 if unavailable
+    instructionCount: int = -1
+    l1Misses: int = -1
+    llMisses: int = -1
+    branchMispredicts: int = -1
+    callgrindEvents: dict = field(default_factory=dict)
+    # from the malloc counting shim, -1 if unavailable
+    allocationsPerOp: float = -1.0
+    bytesAllocatedPerOp: float = -1.0
+    peakRss: int = -1
 
-    def insertInto(self, collection: StandardCollection):
-        try:
-            collection.insert(asdict(self), silent=True)
-            return
-        except DocumentInsertError as e:
-            if "unique constraint violated" in str(e):
-                collection.delete_match(filters=dict(filename=self.filename))
-            else:
-                raise
-        collection.insert(asdict(self), silent=True)
+    def insertInto(self, collection: str):
+        upsertResults(collection, [asdict(self)])
 
     @staticmethod
     def create(
@@ -73,6 +260,9 @@ class BenchmarkResult:
         code: str,
         benchmarkCode: str,
         output: Benchmarker.Output,
+        configHash: str = "",
+        optimized: bool | None = None,
+        limitsHash: str = "",
     ) -> BenchmarkResult:
 
         result = BenchmarkResult(
@@ -80,6 +270,11 @@ class BenchmarkResult:
             code=code,
             benchmarkCode=benchmarkCode,
             output=output.stderr,
+            optimized=optimized,
+            configHash=configHash,
+            limitsHash=limitsHash,
+            status=Benchmarker.status(output),
+            **structuredFields(filename),
         )
 
         if Benchmarker.compFailMsg in output.stderr:
@@ -88,12 +283,578 @@ class BenchmarkResult:
         if Benchmarker.execFailMsg in output.stderr:
             return result
         result.executed = True
-        try:
-            result.runtimeAvg = json.loads(output.stderr)["runtimeAvg"]
-        except (json.JSONDecodeError, KeyError):
-            pass
+        records = Benchmarker.parseRecords(output.stderr)
+        record = next(iter(records.values()), dict())
+
+        events = record.get("callgrind", dict())
+        if events:
+            result.callgrindEvents = events
+            result.instructionCount = events.get("Ir", -1)
+            result.l1Misses = sum(events.get(e, 0) for e in ("I1mr", "D1mr", "D1mw"))
+            result.llMisses = sum(events.get(e, 0) for e in ("ILmr", "DLmr", "DLmw"))
+            result.branchMispredicts = events.get("Bcm", 0) + events.get("Bim", 0)
+
+        iterations = record.get("allocationIterations", 0)
+        if iterations > 0 and record.get("allocations", -1) >= 0:
+            result.allocationsPerOp = record["allocations"] / iterations
+            result.bytesAllocatedPerOp = record["allocatedBytes"] / iterations
+        result.peakRss = record.get("peakRss", -1)
+
+        if "runtimeAvg" not in record:
+            return result
+        result.runtimeAvg = record["runtimeAvg"]
+        result.runtimeError = record.get("runtimeError", -1.0)
+        result.nanobenchConfig = {
+            key: record[key]
+            for key in ("epochs", "minEpochIterations", "minEpochTime")
+            if key in record
+        }
+
+        samples = record.get("samples", [])
+        if samples:
+            elapsed = [sample[0] for sample in samples]
+            result.samplesElapsed = packSamples(elapsed)
+            result.samplesIterations = packSamples([sample[1] for sample in samples])
+            result.runtimeMedian = statistics.median(elapsed)
+            result.runtimeMin = min(elapsed)
+            if len(elapsed) > 1:
+                q1, _, q3 = statistics.quantiles(elapsed, n=4)
+                result.runtimeIqr = q3 - q1
+
+        # counters nanobench could not open are reported as 0
+        instructions = record.get("instructions", 0)
+        cycles = record.get("cpucycles", 0)
+        branches = record.get("branchinstructions", 0)
+        if instructions > 0:
+            result.instructionsPerOp = instructions
+            if cycles > 0:
+                result.ipc = instructions / cycles
+        if branches > 0:
+            result.branchMissRate = record.get("branchmisses", 0) / branches
         return result
 
+
+@dataclass
+class ProfileResult:
+    filename: str
+    # structured form of filename, see structuredFields
+    kind: Literal["example", "task", ""] = ""
+    num: int = -1
+    testNum: int = -1
+    model: str = ""
+    variant: Literal["codeSlow", "codeFast", "agent", ""] = ""
+    optimized: bool | None = None
+    # of the profiled benchmark result
+    configHash: str = ""
+    profiler: Profiler | Literal[""] = ""
+    executed: bool = False
+    # stderr of the profiling run
+    output: str = ""
+    # perf samples or callgrind instructions
+    samples: int = 0
+    # "frame;frame;...;leaf count" lines, from the root to the leaf
+    folded: str = ""
+    # symbols with the most samples of their own, dicts of symbol, samples, share
+    hotSymbols: list[dict] = field(default_factory=list)
+
+    @staticmethod
+    def create(
+        filename: str,
+        profiler: Profiler,
+        output: Benchmarker.Output,
+        configHash: str = "",
+        optimized: bool | None = None,
+        topN: int = 20,
+    ) -> ProfileResult:
+        result = ProfileResult(
+            filename=filename,
+            profiler=profiler,
+            output=output.stderr,
+            configHash=configHash,
+            optimized=optimized,
+            **structuredFields(filename),
+        )
+        if Benchmarker.status(output) != "ok":
+            return result
+
+        stacks = (
+            Benchmarker.foldPerfScript(output.stdout)
+            if profiler == "perf"
+            else Benchmarker.parseCallgrindAnnotate(output.stdout)
+        )
+        if not stacks:
+            return result
+        result.executed = True
+        result.samples = sum(stacks.values())
+        result.folded = "\n".join(
+            f"{stack} {count}"
+            for stack, count in sorted(stacks.items(), key=lambda item: -item[1])
+        )
+
+        selfSamples = dict()
+        for stack, count in stacks.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            selfSamples[leaf] = selfSamples.get(leaf, 0) + count
+        result.hotSymbols = [
+            dict(symbol=symbol, samples=count, share=count / result.samples)
+            for symbol, count in sorted(
+                selfSamples.items(), key=lambda item: -item[1]
+            )[:topN]
+        ]
+        return result
+
+
+def regularizedBeta(x: float, a: float, b: float) -> float:
+    """
+    regularized incomplete beta function I_x(a, b) from its continued fraction
+    (modified Lentz's method)
+    """
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    if x > (a + 1) / (a + b + 2):
+        # the continued fraction converges quickly only below its mean
+        return 1 - regularizedBeta(1 - x, b, a)
+    front = math.exp(
+        math.lgamma(a + b)
+        - math.lgamma(a)
+        - math.lgamma(b)
+        + a * math.log(x)
+        + b * math.log1p(-x)
+    )
+    tiny = 1e-300
+
+    def clamp(value: float) -> float:
+        return value if abs(value) > tiny else tiny
+
+    c = 1.0
+    d = 1 / clamp(1 - (a + b) * x / (a + 1))
+    f = d
+    for m in range(1, 300):
+        for numerator in (
+            m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+            -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1)),
+        ):
+            d = 1 / clamp(1 + numerator * d)
+            c = clamp(1 + numerator / c)
+            f *= c * d
+        if abs(c * d - 1) < 1e-14:
+            break
+    return front * f / a
+
+
+def studentTCdf(t: float, df: float) -> float:
+    tail = regularizedBeta(df / (df + t * t), df / 2, 0.5) / 2
+    return 1 - tail if t > 0 else tail
+
+
+def studentTQuantile(p: float, df: float) -> float:
+    """
+    inverse of studentTCdf by bisection
+    """
+    low, high = -1.0, 1.0
+    while studentTCdf(low, df) > p:
+        low *= 2
+    while studentTCdf(high, df) < p:
+        high *= 2
+    for _ in range(100):
+        mid = (low + high) / 2
+        if studentTCdf(mid, df) < p:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2
+
+
+def pairLogRatios(baseline: list[float], candidate: list[float]) -> list[float]:
+    """
+    log10(candidate / baseline) of the pairs with positive runtimes
+    """
+    return [
+        math.log10(c / b) for b, c in zip(baseline, candidate) if b > 0 and c > 0
+    ]
+
+
+def pairedLogRatio(
+    baseline: list[float],
+    candidate: list[float],
+    confidence: float = 0.95,
+) -> tuple[float, float, float] | None:
+    """
+    mean of the per pair log10(candidate / baseline) runtime ratios and its
+    confidence interval (Student's t with one degree of freedom less than
+    pairs), infinite for a single pair, None if no pair has positive runtimes
+    """
+    logRatios = pairLogRatios(baseline, candidate)
+    if not logRatios:
+        return None
+    mean = statistics.fmean(logRatios)
+    if len(logRatios) < 2:
+        return mean, -math.inf, math.inf
+    t = studentTQuantile((1 + confidence) / 2, len(logRatios) - 1)
+    halfWidth = t * statistics.stdev(logRatios) / math.sqrt(len(logRatios))
+    return mean, mean - halfWidth, mean + halfWidth
+
+
+@dataclass
+class PairedResult:
+    """
+    comparison of a candidate with its baseline measured interleaved in one
+    program (see Benchmarker.renderPairTemplate)
+    """
+
+    code: str
+    benchmarkCode: str
+    output: str
+    # of the candidate, the key of the pair collections
+    filename: str = ""
+    baseline: str = ""
+    # structured form of filename, see structuredFields
+    kind: Literal["example", "task", ""] = ""
+    num: int = -1
+    testNum: int = -1
+    model: str = ""
+    variant: Literal["codeSlow", "codeFast", "agent", ""] = ""
+    optimized: bool | None = None
+    configHash: str = ""
+    compiled: bool = False
+    executed: bool = False
+    status: Status | Literal[""] = ""
+    limitsHash: str = ""
+    pairs: int = 0
+    # runtime ratio candidate / baseline and the confidence interval of its
+    # log10, None if unavailable (JSON has no nan)
+    ratio: float = -1.0
+    log10Ratio: float | None = None
+    log10RatioLow: float | None = None
+    log10RatioHigh: float | None = None
+    confidence: float = 0.95
+    # confidence with which the ratio lies on the side of 1 it was measured on
+    signConfidence: float | None = None
+    # per pair runtimes per iteration, see packSamples
+    samplesBaseline: str = ""
+    samplesCandidate: str = ""
+    # set by the triage (see triageResults.py)
+    verdict: str = ""
+
+    @staticmethod
+    def create(
+        filename: str,
+        baseline: str,
+        code: str,
+        benchmarkCode: str,
+        output: Benchmarker.Output,
+        configHash: str = "",
+        optimized: bool | None = None,
+        confidence: float = 0.95,
+        limitsHash: str = "",
+    ) -> PairedResult:
+        result = PairedResult(
+            filename=filename,
+            baseline=baseline,
+            code=code,
+            benchmarkCode=benchmarkCode,
+            output=output.stderr,
+            optimized=optimized,
+            configHash=configHash,
+            limitsHash=limitsHash,
+            confidence=confidence,
+            status=Benchmarker.status(output),
+            **structuredFields(filename),
+        )
+        if Benchmarker.compFailMsg in output.stderr:
+            return result
+        result.compiled = True
+        if Benchmarker.execFailMsg in output.stderr:
+            return result
+        samples = Benchmarker.parsePair(output.stderr)
+        if samples is None or pairedLogRatio(*samples) is None:
+            return result
+        result.executed = True
+        result.addSamples(*samples)
+        return result
+
+    def addSamples(self, baseline: list[float], candidate: list[float]):
+        """
+        append the runtimes of further pairs and update the statistics
+        """
+        baseline = unpackSamples(self.samplesBaseline) + baseline
+        candidate = unpackSamples(self.samplesCandidate) + candidate
+        self.samplesBaseline = packSamples(baseline)
+        self.samplesCandidate = packSamples(candidate)
+        self.pairs = len(baseline)
+        stats = pairedLogRatio(baseline, candidate, confidence=self.confidence)
+        if stats is None:
+            return
+        log10Ratio, low, high = stats
+        self.log10Ratio = log10Ratio
+        self.ratio = 10**log10Ratio
+        self.log10RatioLow = self.log10RatioHigh = self.signConfidence = None
+        if math.isfinite(low) and math.isfinite(high):
+            self.log10RatioLow, self.log10RatioHigh = low, high
+            # the widest interval still excluding 0
+            df = len(pairLogRatios(baseline, candidate)) - 1
+            t = studentTQuantile((1 + self.confidence) / 2, df)
+            standardError = (high - low) / (2 * t)
+            if standardError > 0:
+                self.signConfidence = (
+                    2 * studentTCdf(abs(log10Ratio) / standardError, df) - 1
+                )
+
+
+def upsertResults(collection: str, docs: list[dict]):
+    """
+    insert or replace result documents keyed on filename in a single round trip
+    """
+    DB.store().upsert(collection, docs)
+
+
+def backfillStructuredFields(collection: str, optimized: bool | None = None):
+    """
+    add the structured fields to results stored before they existed,
+    optimized defaults to the level in the collection name (see DB)
+    """
+    if optimized is None:
+        optimized = "-unoptimized" not in collection
+    store = DB.store()
+    filenames = [
+        doc["filename"]
+        for doc in store.find(collection, fields=["filename", "kind"])
+        if not doc.get("kind") and structuredFields(doc.get("filename", ""))
+    ]
+    for i in range(0, len(filenames), 100):
+        docs = [
+            dict(optimized=optimized) | doc | structuredFields(doc["filename"])
+            for doc in map(
+                lambda filename: store.get(collection, filename),
+                filenames[i : i + 100],
+            )
+        ]
+        upsertResults(collection, docs)
+
+
+def getCompletedHashes(
+    collection: str,
+    limitsHash: str | None = None,
+) -> dict[str, str]:
+    """
+    config hashes of the successfully executed results and of the ones that
+    exceeded a limit (rerunning them would only hit it again) under the limits
+    with limitsHash (any limits if None), keyed by filename
+    """
+    return {
+        doc["filename"]: doc.get("configHash")
+        for doc in DB.store().find(
+            collection,
+            fields=["filename", "configHash", "executed", "status", "limitsHash"],
+        )
+        if doc.get("executed")
+        or (
+            doc.get("status") in ("timeout", "oom")
+            and limitsHash in (None, doc.get("limitsHash"))
+        )
+    }
+
+
+def pendingFilter(
+    collection: str,
+    force: bool = False,
+    only: list[str] | None = None,
+    limitsHash: str | None = None,
+) -> Callable[[str, str], bool]:
+    """
+    predicate telling whether a sweep has to run the job (filename, configHash):
+    the filename matches one of the glob patterns in only and, unless forced,
+    there is no completed result with the same config hash yet
+    (see getCompletedHashes for limitsHash)
+    """
+    completed = dict() if force else getCompletedHashes(collection, limitsHash)
+
+    def pending(filename: str, configHash: str) -> bool:
+        if only and not any(fnmatch(filename, pattern) for pattern in only):
+            return False
+        return completed.get(filename) != configHash
+
+    return pending
+
+
+def parseSweepArgs(
+    description: str,
+    parser: argparse.ArgumentParser | None = None,
+    resumable: bool = True,
+) -> argparse.Namespace:
+    """
+    command line of the sweep scripts, selects the store as a side effect,
+    parser may bring arguments of its own, --force only for resumable sweeps
+    """
+    if parser is None:
+        parser = argparse.ArgumentParser()
+    parser.description = description
+    if resumable:
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="rerun jobs that already have a result for the current configuration",
+        )
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        metavar="PATTERN",
+        help="only run jobs whose result filename matches one of the glob patterns",
+    )
+    parser.add_argument(
+        "--sqlite",
+        metavar="PATH",
+        help="use the embedded SQLite store at PATH instead of the ArangoDB server",
+    )
+    args = parser.parse_args()
+    if args.sqlite is not None:
+        DB.configure(backend="sqlite", path=args.sqlite)
+    return args
+
+
+class SweepJournal:
+    """
+    Write-ahead log of the results of a sweep, one JSON document per line.
+    Every result is appended and synced to disk before it is buffered for the
+    database, so results of an interrupted sweep are not lost and are replayed
+    on the next start.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.file = None
+
+    def replay(self) -> list[dict]:
+        if not self.path.is_file():
+            return []
+        docs = []
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    docs.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # torn last line of a crashed sweep
+                    break
+        return docs
+
+    def append(self, doc: dict):
+        line = json.dumps(doc) + "\n"
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, "a")
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def clear(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.path.unlink(missing_ok=True)
+
+
+class ResultWriter:
+    """
+    Buffers benchmark results and upserts them in bulk.
+    The buffer is flushed once it holds flushSize results, at least every
+    flushInterval seconds from a background thread, on close and at exit.
+    Results are journaled until they are written, a journal left behind by an
+    interrupted sweep is replayed into the collection on start. A failed
+    upsert keeps its results buffered and journaled, the error of a background
+    flush is raised by the next write or close.
+    """
+
+    journalDir = ".sweep-journal"
+
+    def __init__(
+        self,
+        collection: str,
+        flushSize: int = 100,
+        flushInterval: float = 5.0,
+    ):
+        DB.results(collection)
+        self.journal = SweepJournal(f"{ResultWriter.journalDir}/{collection}.jsonl")
+        docs = self.journal.replay()
+        for i in range(0, len(docs), flushSize):
+            upsertResults(collection, docs[i : i + flushSize])
+        self.journal.clear()
+
+        self.collection = collection
+        self.flushSize = flushSize
+        self.flushInterval = flushInterval
+        self.buffer: list[dict] = []
+        self.lock = threading.Lock()
+        # held while writing to the database so that write() is not blocked by it
+        self.flushLock = threading.Lock()
+        self.stopped = threading.Event()
+        self.error: Exception | None = None
+        self.flusher = threading.Thread(target=self.flushPeriodically, daemon=True)
+        self.flusher.start()
+        atexit.register(self.close)
+
+    def flushPeriodically(self):
+        while not self.stopped.wait(self.flushInterval):
+            try:
+                self.flush()
+            except Exception as e:
+                self.error = e
+
+    def raiseError(self):
+        error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+    def write(self, result: BenchmarkResult | ProfileResult | PairedResult):
+        self.raiseError()
+        doc = asdict(result)
+        self.journal.append(doc)
+        with self.lock:
+            self.buffer.append(doc)
+            full = len(self.buffer) >= self.flushSize
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self.flushLock:
+            with self.lock:
+                docs, self.buffer = self.buffer, []
+            if not docs:
+                return
+            try:
+                upsertResults(self.collection, docs)
+            except Exception:
+                with self.lock:
+                    self.buffer = docs + self.buffer
+                raise
+
+    def close(self):
+        """
+        write the remaining results, the journal is only cleared once all
+        results are written
+        """
+        if not self.stopped.is_set():
+            self.stopped.set()
+            self.flusher.join()
+            atexit.unregister(self.close)
+        error, self.error = self.error, None
+        self.flush()
+        self.journal.clear()
+        if error is not None:
+            # written on retry, but the sweep should learn about it
+            raise error
+
+    def __enter__(self) -> ResultWriter:
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
 @dataclass
 class TestInfo:
     testFile: str